@@ -1,9 +1,27 @@
 # app.py
+import hashlib
+import json
+import os
 import streamlit as st
 from generator import generate_draft, export_to_word
+from pdf_writer import PdfExporter
 
 st.set_page_config(page_title="LFTFIELD AI Agents", layout="wide")
 
+# PDFs are rendered in worker processes and kept by their draft and client name
+@st.cache_resource
+def get_pdf_exporter():
+    return PdfExporter(workers=int(os.getenv("PDF_WORKERS", "2")))
+
+pdf_exporter = get_pdf_exporter()
+
+# Polls a PDF render without rerunning the whole script
+@st.fragment(run_every=1.0)
+def pdf_progress(pdf_key):
+    if pdf_exporter.get(pdf_key).done():
+        st.rerun()
+    st.info("Rendering PDF...")
+
 # Load questions
 QUESTIONS = {
     "brand": [
@@ -86,12 +104,26 @@ if st.session_state.draft:
         )
     
     with col2:
-        st.download_button(
-            label="Download as PDF (coming soon)",
-            data="PDF export in Phase 2",
-            file_name="strategy.pdf",
-            disabled=True
-        )
+        payload = json.dumps([edited, client_name, "pdf"])
+        pdf_key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        pdf_render = pdf_exporter.get(pdf_key)
+        if pdf_render is None and st.button("Prepare PDF"):
+            pdf_render = pdf_exporter.submit(pdf_key, edited, client_name)
+        if pdf_render is not None and not pdf_render.done():
+            pdf_progress(pdf_key)
+        elif pdf_render is not None:
+            try:
+                st.download_button(
+                    label="Download as PDF",
+                    data=pdf_render.result(),
+                    file_name=f"{client_name.replace(' ', '_')}_Strategy.pdf",
+                    mime="application/pdf"
+                )
+            except Exception as e:
+                st.error(f"Error creating PDF: {e}")
+                if st.button("Retry PDF"):
+                    pdf_exporter.submit(pdf_key, edited, client_name)
+                    st.rerun()
 
     # Feedback
     col1, col2 = st.columns(2)
@@ -1,247 +1,38 @@
 # app.py
+import hashlib
+import json
+import os
 import streamlit as st
-from generator2 import generate_draft, export_to_word
+from generator2 import stream_draft, update_draft, export_to_word, response_cache, llm
+from job_queue import JobQueue
+from outlines import impacted_sections
+from pdf_writer import PdfExporter
+from questions import BRAND_QUESTIONS, DIGITAL_QUESTIONS, QUESTIONS, client_name_from_answers, validate_answers
 
 st.set_page_config(page_title="LFTFIELD AI Agents", layout="wide")
 
-# Updated Questions with better structure
-BRAND_QUESTIONS = [
-    {
-        "id": "company_overview",
-        "question": "What is the company name and what does it do?",
-        "placeholder": "e.g., Markhor - A brand representing Pakistani military values, operating in the defense sector...",
-        "help": "Provide company name, industry, and what the company does"
-    },
-    {
-        "id": "brand_wheel",
-        "question": "Complete the Brand Wheel (5 components):",
-        "placeholder": """Attributes (3-5): Power, Discipline, Resilience...
-Benefits (3-5): Enhanced national pride, quality assurance...
-Values (3-5): Honor, Commitment, Excellence...
-Personality (3-5): Authoritative, Inspirational, Bold...
-Essence (1 phrase): "Strength in Unity" """,
-        "help": "This framework helps define your brand identity comprehensively"
-    },
-    {
-        "id": "target_personas",
-        "question": "Describe 2-3 target audience personas in detail:",
-        "placeholder": """Persona 1: The Veteran
-- Demographics: Age 45-60, High School Diploma, Urban, $40K-$70K income
-- Background: Retired military personnel
-- Goals: Maintain connection with military life
-- Challenges: Reintegrating into civilian life
-- Motivations: Inspire younger generations
+# One job queue per server process; drafts are generated by its workers, not by the script
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(stream_draft, update_draft, workers=int(os.getenv("JOB_WORKERS", "2")))
 
-Persona 2: The Young Patriot
-- Demographics: Age 18-30, Bachelor's degree, Urban/Suburban, $20K-$40K
-- ...""",
-        "help": "Include demographics, background, goals, challenges, and motivations"
-    },
-    {
-        "id": "competitors",
-        "question": "Who are 2-3 main competitors and what can you learn from them?",
-        "placeholder": """Competitor 1: Pakistan Army Welfare Trust
-- What they offer: Housing, healthcare, educational services
-- Strengths: Government backing, extensive network
-- Key learning: Community support enhances loyalty
+job_queue = get_job_queue()
 
-Competitor 2: Armed Forces Foundation
-- ...""",
-        "help": "Analyze competitors to understand the competitive landscape"
-    },
-    {
-        "id": "positioning",
-        "question": "Complete your positioning statement:",
-        "placeholder": "[Brand]'s [offering] is the only [category] that [unique benefit].\ne.g., Markhor's products are the only military-inspired goods that instill national pride while supporting local economy.",
-        "help": "Use the formula: [Brand]'s [offering] is the only [category] that [benefit]"
-    },
-    {
-        "id": "brand_story",
-        "question": "Tell your brand story (2-3 paragraphs):",
-        "placeholder": "What inspired your brand? What problem do you solve? What emotional connection should it create? Include customer pain points you address.",
-        "help": "This should spark an emotional reaction and explain your purpose"
-    },
-    {
-        "id": "brand_values",
-        "question": "What are your 3-5 core brand values with descriptions?",
-        "placeholder": """Honor: We uphold the highest standards of integrity...
-Commitment: We are dedicated to serving our community...
-Excellence: We strive for highest quality...""",
-        "help": "Avoid clichés like 'honest' or 'transparent' - be specific and meaningful"
-    },
-    {
-        "id": "brand_mission",
-        "question": "What is your brand mission?",
-        "placeholder": "Where is your brand heading? What do you aim to achieve? (2-3 sentences)",
-        "help": "Describe your long-term vision and goals"
-    },
-    {
-        "id": "touchpoints",
-        "question": "List 5-8 brand touchpoints (where customers interact with you):",
-        "placeholder": "Website, Social Media, Events, Retail Outlets, Customer Service, Mobile App, Packaging, Email...",
-        "help": "All places where customers come in contact with your brand"
-    },
-    {
-        "id": "brand_messaging",
-        "question": "What are your 3-5 key brand messages?",
-        "placeholder": """"Embrace the Spirit of the Military"
-"Strength in Every Purchase"
-"Support Local, Honor Tradition"
-...""",
-        "help": "These are core messages you'll communicate consistently"
-    },
-    {
-        "id": "tone_of_voice",
-        "question": "Define your Tone of Voice (3-5 characteristics with do's and don'ts):",
-        "placeholder": """Authoritative - Speaks with confidence | Do: Use clear, strong language | Don't: Show uncertainty
-Inspirational - Motivates audience | Do: Share success stories | Don't: Be overly critical
-Respectful - Acknowledges sacrifices | Do: Show appreciation | Don't: Trivialize experiences
-...""",
-        "help": "How your brand should communicate with the audience"
-    },
-    {
-        "id": "additional_context",
-        "question": "Any additional context about your industry, market, or company? (Optional)",
-        "placeholder": "Any other relevant information that would help create comprehensive brand guidelines...",
-        "help": "Optional: Any extra details that might be helpful",
-        "required": False
-    }
-]
+# Exports, built on request and cached by export_key; the draft itself is not hashed on reruns
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_word_export(key, _draft, client_name):
+    return export_to_word(_draft, client_name).getvalue()
 
-DIGITAL_QUESTIONS = [
-    {
-        "id": "company_background",
-        "question": "Provide company background and existing marketing challenges:",
-        "placeholder": "Company overview, industry position, current challenges (e.g., low brand awareness, limited digital presence, lead generation issues)...",
-        "section": "Introduction"
-    },
-    {
-        "id": "products_services",
-        "question": "List all products/services with brief descriptions:",
-        "placeholder": """Product 1: Early Childhood Diploma - Comprehensive training for ages 2.5-6, target: aspiring teachers
-Product 2: Toddler Assistants Course - 6-week intro course, target: career changers
-...""",
-        "section": "Introduction"
-    },
-    {
-        "id": "marketing_goals",
-        "question": "What are 3-5 SMART marketing goals?",
-        "placeholder": """Goal 1: Increase website traffic by 50% in 6 months through SEO and content marketing
-Goal 2: Generate 100 qualified leads per month by end of Q2 through landing pages
-Goal 3: Boost social media engagement by 30% in 4 months through consistent posting
-...""",
-        "section": "Introduction",
-        "help": "Specific, Measurable, Achievable, Relevant, Time-bound"
-    },
-    {
-        "id": "swot",
-        "question": "Complete SWOT Analysis:",
-        "placeholder": """Strengths: Experienced leadership, MACTE accreditation, comprehensive curriculum, high-quality instruction...
-Weaknesses: Limited digital presence, low brand awareness, new endeavor, no lead generation yet...
-Opportunities: Growing Montessori education demand, digital marketing leverage, partnerships...
-Threats: Strong competition, economic factors, changing educational trends, regulatory changes...""",
-        "section": "SWOT Analysis",
-        "help": "List 3-5 items for each category"
-    },
-    {
-        "id": "competitive_analysis",
-        "question": "Describe 2-3 main competitors and key learnings:",
-        "placeholder": """Competitor 1: Canadian Montessori Teacher Education Institute
-- Location: Mississauga, Ontario | MACTE accredited
-- Offers: Early Childhood, Infant & Toddler, Elementary diplomas
-- Strengths: Small class sizes, experienced faculty, flexible scheduling
-- Learning: Personalized instruction attracts adult learners
+# PDFs are rendered in worker processes and kept by export_key in the exporter
+@st.cache_resource
+def get_pdf_exporter():
+    return PdfExporter(workers=int(os.getenv("PDF_WORKERS", "2")))
 
-Competitor 2: ...""",
-        "section": "Market Analysis"
-    },
-    {
-        "id": "target_customers",
-        "question": "Describe 2-3 detailed customer personas:",
-        "placeholder": """Persona 1: Aspiring Montessori Educator
-- Demographics: 25-35, Bachelor's in ECE, Urban areas, limited budget
-- Background: Recent grad, passionate about ECE, some teaching experience
-- Goals: Get Montessori certification, enhance skills, secure position
-- Challenges: Limited finances, balancing work/study, finding in-person training
-- Motivations: Make impact on children, committed to Montessori philosophy
+pdf_exporter = get_pdf_exporter()
 
-Persona 2: Career Changer
-- Demographics: 35-45, Bachelor's in non-education field, suburban, has kids
-- ...""",
-        "section": "Market Analysis"
-    },
-    {
-        "id": "buying_cycle",
-        "question": "Describe the customer buying cycle:",
-        "placeholder": """Awareness: Discover through social media, referrals, Google search - triggered by career change or child's birth
-Consideration: Compare programs, read reviews, attend webinars (weeks to months)
-Decision: Apply after researching accreditation and career outcomes
-Post-Enrollment: Engage with content, join community, become advocates""",
-        "section": "Market Analysis"
-    },
-    {
-        "id": "usp",
-        "question": "What is your Unique Selling Proposition?",
-        "placeholder": "e.g., Only MACTE-accredited in-person Montessori training with 30+ years of expertise, focusing on pure Montessori philosophy",
-        "section": "Brand Positioning"
-    },
-    {
-        "id": "brand_relevance",
-        "question": "How is your brand currently perceived vs. how you want it perceived?",
-        "placeholder": """Current: Niche institution known for dedication to pure Montessori, experienced leadership, supportive environment
-Desired: Premier Montessori training destination, innovative yet traditional, accessible, community-oriented, recognized leader""",
-        "section": "Brand Positioning"
-    },
-    {
-        "id": "website_status",
-        "question": "Website status and needs:",
-        "placeholder": "e.g., Basic site exists, needs SEO optimization, mobile improvements, better CTAs, lead capture forms",
-        "section": "Current Status"
-    },
-    {
-        "id": "social_media_status",
-        "question": "Social media presence and needs:",
-        "placeholder": "e.g., Active on Facebook & Instagram but inconsistent posting, need content calendar and engagement strategy",
-        "section": "Current Status"
-    },
-    {
-        "id": "email_status",
-        "question": "Email marketing status and needs:",
-        "placeholder": "e.g., Have 500 subscribers on Mailchimp, need segmentation, automation, and regular newsletters",
-        "section": "Current Status"
-    },
-    {
-        "id": "other_channels",
-        "question": "SEO, blog, and other channel status:",
-        "placeholder": "SEO: Not optimized, need keyword research | Blog: Have blog but irregular posts | Other: Plan to do webinars, no paid ads yet",
-        "section": "Current Status"
-    },
-    {
-        "id": "marketing_budget",
-        "question": "What is the monthly/annual marketing budget?",
-        "placeholder": "e.g., $5,000/month total, willing to allocate $2,000 for paid ads, rest for content creation and tools",
-        "section": "Budget"
-    },
-    {
-        "id": "friction_points",
-        "question": "Any organizational, process, or resource challenges? (Optional)",
-        "placeholder": "e.g., Small team (2 people), limited design resources, slow content approval process, outdated CRM system",
-        "section": "Budget",
-        "required": False
-    },
-    {
-        "id": "additional_context",
-        "question": "Any additional context or specific requirements? (Optional)",
-        "placeholder": "Timeline expectations, upcoming launches, specific campaigns planned, industry regulations, etc.",
-        "section": "Additional",
-        "required": False
-    }
-]
-
-QUESTIONS = {
-    "brand": BRAND_QUESTIONS,
-    "digital": DIGITAL_QUESTIONS
-}
+def export_key(draft, client_name, export_format, **options):
+    payload = json.dumps([draft, client_name, export_format, options], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 # App
 st.title("🚀 LFTFIELD Marketing Agent Platform")
@@ -257,6 +48,25 @@ if "answers" not in st.session_state:
     st.session_state.answers = {}
 if "draft" not in st.session_state:
     st.session_state.draft = None
+if "draft_metadata" not in st.session_state:
+    st.session_state.draft_metadata = None
+if "job_ids" not in st.session_state:
+    # Reattach to this browser's jobs after a page refresh
+    st.session_state.job_ids = [job_id for job_id in st.query_params.get("jobs", "").split(",") if job_id]
+    st.session_state.active_job = st.query_params.get("active") or None
+if "loaded_job" not in st.session_state:
+    st.session_state.loaded_job = None
+if "exports" not in st.session_state:
+    # Keys of the exports built in this session, served from cache on later reruns
+    st.session_state.exports = set()
+if "draft_answers" not in st.session_state:
+    # The answers the current draft was written from, for updating it section by section
+    st.session_state.draft_answers = None
+
+def sync_job_params():
+    st.query_params["jobs"] = ",".join(st.session_state.job_ids)
+    if st.session_state.active_job:
+        st.query_params["active"] = st.session_state.active_job
 
 # Q&A Flow
 st.subheader(f"{agent} – Answer Questions")
@@ -311,38 +121,125 @@ else:
         )
         st.session_state.answers[q["id"]] = ans
 
-# Validate required fields
-def validate_answers():
-    missing = []
-    for q in questions:
-        if q.get("required", True):
-            if q["id"] not in st.session_state.answers or not st.session_state.answers[q["id"]].strip():
-                missing.append(q["question"])
-    return missing
-
 # Generate Button
-col1, col2 = st.columns([3, 1])
+st.checkbox(
+    "♻️ Regenerate (bypass cache)",
+    key="bypass_cache",
+    help="Drafts are cached by answers, templates and prompt. Tick this to force a fresh generation."
+)
+col1, col2, col3 = st.columns([2, 1, 1])
 with col1:
     if st.button("✨ Generate Draft", type="primary", use_container_width=True):
-        missing = validate_answers()
+        missing = validate_answers(questions, st.session_state.answers)
         if missing:
             st.error(f"⚠️ Please answer all required questions:\n\n" + "\n".join([f"• {q}" for q in missing]))
         else:
-            with st.spinner("🤖 Generating draft using RAG + GPT-4o-mini..."):
-                try:
-                    draft = generate_draft(agent_key, st.session_state.answers)
-                    st.session_state.draft = draft
-                    st.success("✅ Draft generated successfully!")
-                    st.balloons()
-                except Exception as e:
-                    st.error(f"❌ Error generating draft: {e}")
-                    st.exception(e)
+            # Generation runs on the job queue's workers; progress is shown below
+            job_id = job_queue.submit(
+                agent_key, dict(st.session_state.answers),
+                use_cache=not st.session_state.bypass_cache
+            )
+            st.session_state.job_ids.append(job_id)
+            st.session_state.active_job = job_id
+            st.session_state.draft = None
+            st.session_state.draft_metadata = None
+            st.session_state.draft_answers = None
+            sync_job_params()
 
 with col2:
+    can_update = bool(
+        st.session_state.draft and st.session_state.draft_answers
+        and (st.session_state.draft_metadata or {}).get("agent_type") == agent_key
+    )
+    if st.button("🔁 Update Draft", use_container_width=True, disabled=not can_update,
+                 help="Rewrites only the sections that depend on the answers you changed, keeping your edits elsewhere."):
+        missing = validate_answers(questions, st.session_state.answers)
+        sections = impacted_sections(agent_key, st.session_state.draft_answers, st.session_state.answers)
+        if missing:
+            st.error(f"⚠️ Please answer all required questions:\n\n" + "\n".join([f"• {q}" for q in missing]))
+        elif not sections:
+            st.info("No answers changed since this draft was generated.")
+        else:
+            # Rewritten on the job queue like a new draft, so a refresh reattaches to it
+            job_id = job_queue.submit_update(
+                agent_key, dict(st.session_state.answers), st.session_state.draft,
+                st.session_state.draft_answers, st.session_state.draft_metadata
+            )
+            st.session_state.job_ids.append(job_id)
+            st.session_state.active_job = job_id
+            st.session_state.draft = None
+            st.session_state.draft_metadata = None
+            st.session_state.draft_answers = None
+            sync_job_params()
+
+with col3:
     if st.button("🔄 Reset Form", use_container_width=True):
         st.session_state.answers = {}
         st.session_state.draft = None
+        st.session_state.draft_metadata = None
+        st.session_state.draft_answers = None
+        st.session_state.job_ids = []
+        st.session_state.active_job = None
+        st.session_state.loaded_job = None
+        st.query_params.clear()
+        st.rerun()
+
+# Polls a PDF render the same way
+@st.fragment(run_every=1.0)
+def pdf_progress(pdf_key):
+    if pdf_exporter.get(pdf_key).done():
         st.rerun()
+    st.info("⏳ Rendering PDF...")
+
+# Polls the active job without rerunning the whole script
+@st.fragment(run_every=1.0)
+def job_progress(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        st.warning("This generation job no longer exists.")
+        return
+    if job["status"] in ("done", "failed"):
+        st.rerun()  # the full run below picks up the result
+    if job["status"] == "queued":
+        st.info("⏳ Waiting for a free worker...")
+    elif job["kind"] == "update":
+        sections = impacted_sections(job["agent_type"], job["source"]["answers"], job["answers"])
+        st.info(f"🤖 Rewriting {len(sections)} sections: {', '.join(s['title'] for s in sections)}...")
+    else:
+        st.info("🤖 Generating draft using RAG + GPT-4o-mini...")
+    if job["kind"] == "update":
+        st.markdown(job["source"]["draft"])
+    elif job["partial"]:
+        st.markdown(job["partial"])
+
+active_job = job_queue.get(st.session_state.active_job) if st.session_state.active_job else None
+if active_job and active_job["status"] in ("queued", "running"):
+    st.divider()
+    st.subheader("📄 Generated Draft")
+    job_progress(active_job["id"])
+elif active_job and st.session_state.loaded_job != active_job["id"]:
+    st.session_state.loaded_job = active_job["id"]
+    if active_job["status"] == "done":
+        st.session_state.draft = active_job["draft"]
+        st.session_state.draft_metadata = active_job["metadata"]
+        st.session_state.draft_answers = active_job["answers"]
+        if active_job["kind"] == "update":
+            st.success(f"✅ Updated: {', '.join(active_job['metadata']['updated_sections'])}")
+        elif active_job["metadata"] and active_job["metadata"].get("cached"):
+            st.success("⚡ Served from cache - tick \"Regenerate\" above for a fresh draft")
+        else:
+            st.success("✅ Draft generated successfully!")
+            st.balloons()
+        if active_job["metadata"] and active_job["metadata"].get("repaired_sections"):
+            st.info("🩹 Rewrote incomplete sections: " + ", ".join(active_job["metadata"]["repaired_sections"]))
+    elif active_job["kind"] == "update":
+        # Keep the draft that was being updated
+        st.session_state.draft = active_job["source"]["draft"]
+        st.session_state.draft_metadata = active_job["source"]["metadata"]
+        st.session_state.draft_answers = active_job["source"]["answers"]
+        st.error(f"❌ Error updating draft: {active_job['error']}")
+    else:
+        st.error(f"❌ Error generating draft: {active_job['error']}")
 
 # Show Draft
 if st.session_state.draft:
@@ -354,6 +251,18 @@ if st.session_state.draft:
     
     with tab1:
         st.markdown(st.session_state.draft)
+        
+        draft_metadata = st.session_state.draft_metadata
+        if draft_metadata and draft_metadata.get("context_chunks"):
+            with st.expander(f"📚 Template sections used ({draft_metadata['context_tokens']} tokens)"):
+                for chunk in draft_metadata["context_chunks"]:
+                    st.caption(f"{chunk['heading_path'] or chunk['id']} · {chunk['tokens']} tokens")
+        usage = (draft_metadata or {}).get("usage")
+        if usage and not draft_metadata.get("cached"):
+            first_token = draft_metadata.get("first_token_seconds")
+            st.caption(f"Prompt tokens: {usage['prompt_tokens']} ({usage['cached_tokens']} cached) · "
+                       f"completion tokens: {usage['completion_tokens']}"
+                       + (f" · first text after {first_token:.1f}s" if first_token is not None else ""))
     
     with tab2:
         edited = st.text_area(
@@ -373,34 +282,48 @@ if st.session_state.draft:
     st.subheader("📥 Export Document")
     
     # Get client name from first answer
-    client_name = st.session_state.answers.get("company_overview", "Client")
-    if "\n" in client_name:
-        client_name = client_name.split("\n")[0]
-    client_name = client_name[:50]  # Truncate if too long
+    client_name = client_name_from_answers(st.session_state.answers)
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        try:
-            word_buffer = export_to_word(st.session_state.draft, client_name)
-            st.download_button(
-                label="📄 Download as Word (.docx)",
-                data=word_buffer,
-                file_name=f"{client_name.replace(' ', '_')}_Strategy.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                use_container_width=True
-            )
-        except Exception as e:
-            st.error(f"Error creating Word document: {e}")
+        word_key = export_key(st.session_state.draft, client_name, "docx")
+        if word_key in st.session_state.exports or st.button("📄 Prepare Word (.docx)", use_container_width=True):
+            try:
+                with st.spinner("Building Word document..."):
+                    word_bytes = build_word_export(word_key, st.session_state.draft, client_name)
+                st.session_state.exports.add(word_key)
+                st.download_button(
+                    label="📄 Download as Word (.docx)",
+                    data=word_bytes,
+                    file_name=f"{client_name.replace(' ', '_')}_Strategy.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                    use_container_width=True
+                )
+            except Exception as e:
+                st.error(f"Error creating Word document: {e}")
     
     with col2:
-        st.download_button(
-            label="📑 Download as PDF",
-            data="PDF export coming in Phase 2",
-            file_name="strategy.pdf",
-            disabled=True,
-            use_container_width=True
-        )
+        pdf_key = export_key(st.session_state.draft, client_name, "pdf")
+        pdf_render = pdf_exporter.get(pdf_key)
+        if pdf_render is None and st.button("📑 Prepare PDF", use_container_width=True):
+            pdf_render = pdf_exporter.submit(pdf_key, st.session_state.draft, client_name)
+        if pdf_render is not None and not pdf_render.done():
+            pdf_progress(pdf_key)
+        elif pdf_render is not None:
+            try:
+                st.download_button(
+                    label="📑 Download as PDF",
+                    data=pdf_render.result(),
+                    file_name=f"{client_name.replace(' ', '_')}_Strategy.pdf",
+                    mime="application/pdf",
+                    use_container_width=True
+                )
+            except Exception as e:
+                st.error(f"Error creating PDF: {e}")
+                if st.button("🔁 Retry PDF", use_container_width=True):
+                    pdf_exporter.submit(pdf_key, st.session_state.draft, client_name)
+                    st.rerun()
     
     with col3:
         # Copy to clipboard (markdown)
@@ -469,6 +392,30 @@ with st.sidebar:
         answered = sum(1 for v in st.session_state.answers.values() if v.strip())
         st.metric("Answered", f"{answered}/{len(questions)}")
     
+    cache_stats = response_cache.stats()
+    st.metric("Cached drafts", cache_stats["entries"])
+    st.caption(f"Cache hits: {cache_stats['hits']} · misses: {cache_stats['misses']}")
+    
+    llm_stats = llm.metrics()
+    st.caption(f"LLM queue: {llm_stats['queued']} waiting · {llm_stats['in_flight']} in flight · "
+               f"{llm_stats['retries']} retries · {llm_stats['failures']} failed · "
+               f"{llm_stats['cached_ratio']:.0%} of prompt tokens cached")
+    
+    if st.session_state.job_ids:
+        st.divider()
+        st.header("🗂️ Drafts")
+        status_icons = {"queued": "⏳", "running": "🤖", "done": "✅", "failed": "❌"}
+        for job in reversed(job_queue.get_many(st.session_state.job_ids)):
+            kind = " update" if job["kind"] == "update" else ""
+            label = f"{status_icons[job['status']]} {job['agent_type'].title()}{kind} · {job['id']}"
+            if job["id"] == st.session_state.active_job:
+                st.caption(f"{label} (shown)")
+            elif st.button(label, key=f"open_{job['id']}", use_container_width=True):
+                st.session_state.active_job = job["id"]
+                st.session_state.loaded_job = None
+                sync_job_params()
+                st.rerun()
+    
     st.divider()
     
     st.caption("Built by LFTFIELD Inc. © 2025")
\ No newline at end of file
@@ -0,0 +1,190 @@
+# batch_generate.py
+"""
+Generates drafts for every intake record in a JSONL file, without the Streamlit app.
+
+    python batch_generate.py intake.jsonl --output-dir ./batch_output --workers 4
+
+Each line is {"id": "...", "agent_type": "brand" | "digital", "answers": {question_id: answer}}
+with answers keyed like the ids in questions.py; "id" and "client_name" are optional.
+Records are validated like the app does, generated concurrently and written as
+<id>.md and <id>.docx. The .docx is streamed by ooxml_writer unless
+--docx-engine python-docx asks for generator2.export_to_word. Every finished record is appended to results.jsonl, and records
+already listed there as ok or invalid are skipped when the run is started again.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ooxml_writer import write_docx
+from questions import QUESTIONS, client_name_from_answers, validate_answers
+from storage import read_jsonl
+
+OUTPUT_DIR = "./batch_output"
+RESULTS_NAME = "results.jsonl"
+DOCX_ENGINES = ("ooxml", "python-docx")
+
+# Statuses that are final; records that failed with "error" are retried on the next run
+DONE_STATUSES = ("ok", "invalid")
+
+
+def record_id(record):
+    """The record's own id, or a hash of its content so reruns map to the same outputs."""
+    if record.get("id"):
+        raw = str(record["id"])
+        rid = re.sub(r"[^\w.-]+", "_", raw).strip("._") or "record"
+        if rid != raw:
+            # Distinct ids can sanitize to the same name ("a/b", "a_b"); the hash keeps them apart
+            rid += "-" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:8]
+        return rid
+    payload = json.dumps([record.get("agent_type"), record.get("answers")], sort_keys=True)
+    return "record-" + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def iter_records(path):
+    """Yields (line number, record or None, error) without reading the whole file."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "record is not a JSON object"
+                continue
+            yield line_number, record, None
+
+
+def load_results(path):
+    return {result["id"]: result for result in read_jsonl(path) if result.get("status") in DONE_STATUSES}
+
+
+def record_answers(answers):
+    """Answers as strings; null counts as unanswered."""
+    return {key: "" if value is None else value if isinstance(value, str) else str(value)
+            for key, value in answers.items()}
+
+
+def check_record(record):
+    """Returns a list of problems; empty when the record can be generated."""
+    agent_type = record.get("agent_type")
+    if agent_type not in QUESTIONS:
+        return [f"unknown agent_type: {agent_type!r}, must be one of {sorted(QUESTIONS)}"]
+    answers = record.get("answers")
+    if not isinstance(answers, dict):
+        return ["answers must be an object of {question_id: answer}"]
+    return [f"missing answer: {question}"
+            for question in validate_answers(QUESTIONS[agent_type], record_answers(answers))]
+
+
+def generate_record(generator, record, rid, output_dir, use_cache, docx_engine="ooxml"):
+    started = time.time()
+    answers = record_answers(record["answers"])
+    draft, metadata = generator.generate_draft_with_metadata(record["agent_type"], answers, use_cache=use_cache)
+    if not draft:
+        raise RuntimeError("the model returned an empty draft")
+    client_name = record.get("client_name") or client_name_from_answers(answers)
+
+    md_path = os.path.join(output_dir, f"{rid}.md")
+    docx_path = os.path.join(output_dir, f"{rid}.docx")
+    with open(md_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(draft)
+    if docx_engine == "ooxml":
+        write_docx(draft, client_name, docx_path + ".tmp")
+    else:
+        with open(docx_path + ".tmp", "wb") as f:
+            f.write(generator.export_to_word(draft, client_name).getvalue())
+    os.replace(md_path + ".tmp", md_path)
+    os.replace(docx_path + ".tmp", docx_path)
+    return {
+        "markdown": md_path,
+        "docx": docx_path,
+        "client_name": client_name,
+        "cached": bool(metadata.get("cached")),
+        "context_tokens": metadata.get("context_tokens"),
+        "seconds": round(time.time() - started, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate drafts for a JSONL file of intake records")
+    parser.add_argument("input", help="JSONL file, one {agent_type, answers} record per line")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help=f"Where drafts are written (default: {OUTPUT_DIR})")
+    parser.add_argument("--workers", type=int, default=4, help="Drafts generated at the same time (default: 4)")
+    parser.add_argument("--results", help=f"Results log (default: <output-dir>/{RESULTS_NAME})")
+    parser.add_argument("--no-cache", action="store_true", help="Regenerate even when a cached draft exists")
+    parser.add_argument("--restart", action="store_true", help="Ignore the results log and process every record")
+    parser.add_argument("--docx-engine", choices=DOCX_ENGINES, default="ooxml",
+                        help="ooxml streams the .docx directly (default); python-docx builds it with export_to_word")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    results_path = args.results or os.path.join(args.output_dir, RESULTS_NAME)
+    if args.restart and os.path.exists(results_path):
+        os.remove(results_path)
+    done = load_results(results_path)
+    print(f"{len(done)} records already done")
+
+    # Imported here so --help and argument errors do not load models and indexes
+    import generator2
+    generator2.load_templates()
+
+    results_lock = threading.Lock()
+    counts = {"ok": 0, "invalid": 0, "error": 0, "skipped": 0}
+
+    def record_result(result):
+        with results_lock:
+            counts[result["status"]] += 1
+            with open(results_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+            print(f"[{result['status']}] {result['id']}" + (f": {result['error']}" if result.get("error") else ""))
+
+    def run(record, rid, line_number):
+        base = {"id": rid, "line": line_number, "agent_type": record.get("agent_type")}
+        try:
+            record_result(dict(base, status="ok", **generate_record(
+                generator2, record, rid, args.output_dir, not args.no_cache, args.docx_engine)))
+        except Exception as e:
+            record_result(dict(base, status="error", error=f"{e.__class__.__name__}: {e}"))
+
+    started = time.time()
+    seen = set()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        pending = set()
+        for line_number, record, error in iter_records(args.input):
+            if error:
+                if f"line-{line_number}" in done:
+                    counts["skipped"] += 1
+                    continue
+                record_result({"id": f"line-{line_number}", "line": line_number, "status": "invalid", "error": error})
+                continue
+            rid = record_id(record)
+            if rid in done or rid in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(rid)
+            problems = check_record(record)
+            if problems:
+                record_result({"id": rid, "line": line_number, "agent_type": record.get("agent_type"),
+                               "status": "invalid", "error": "; ".join(problems)})
+                continue
+            # Keep only a few records in memory ahead of the workers
+            if len(pending) >= args.workers * 2:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+            pending.add(executor.submit(run, record, rid, line_number))
+        wait(pending)
+
+    print(f"Done in {time.time() - started:.1f}s: {counts['ok']} ok, {counts['invalid']} invalid, "
+          f"{counts['error']} failed, {counts['skipped']} skipped")
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,157 @@
+# branded_base.py
+"""
+The LFTFIELD-branded starting point for exported documents.
+
+The brand template is stripped once per process down to what an export inherits:
+styles, numbering, theme, fonts (embedded fonts included), settings, and the
+section's page setup with its headers and footers (logo images included). The
+template's own content and anything only it referenced are dropped. Styles the
+exports use but the template lacks (lists, quotes, table grid) are merged in from
+python-docx's default template. The result is kept as compact .docx bytes and every
+export opens its own copy of them with new_document().
+"""
+import copy
+import io
+import os
+import threading
+
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.parts.numbering import NumberingPart
+
+BRAND_TEMPLATE_PATH = os.getenv("BRAND_TEMPLATE_PATH", "./Brand Guideline.docx")
+
+# Styles the exports use (see markdown_docx), by their python-docx names
+REQUIRED_STYLES = [
+    "Title", "Heading 1", "Heading 2", "Heading 3", "Heading 4",
+    "List Bullet", "List Bullet 2", "List Bullet 3", "List Number", "List Number 2", "List Number 3",
+    "Quote", "Table Grid",
+]
+
+# Document relationships that carry the look of the template; any other relationship
+# (images, hyperlinks, comments) survives only if the remaining XML still uses it
+KEEP_RELATIONSHIPS = {
+    RT.STYLES, RT.NUMBERING, RT.SETTINGS, RT.WEB_SETTINGS, RT.FONT_TABLE, RT.THEME,
+    RT.HEADER, RT.FOOTER, RT.FOOTNOTES, RT.ENDNOTES,
+    "http://schemas.microsoft.com/office/2007/relationships/stylesWithEffects",
+}
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W = "{%s}" % W_NS
+R_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+_bases = {}
+_bases_lock = threading.Lock()
+
+
+def _strip_content(doc):
+    """Removes the body content, keeping the final section properties, and unused relationships."""
+    body = doc.element.body
+    for child in list(body):
+        if child is not body.sectPr:
+            body.remove(child)
+    used = {value for element in doc.element.iter() for name, value in element.attrib.items() if name == R_ID}
+    rels = doc.part.rels
+    for r_id in [r_id for r_id, rel in rels.items() if rel.reltype not in KEEP_RELATIONSHIPS and r_id not in used]:
+        rels.pop(r_id)
+
+
+def _ensure_numbering(doc):
+    """
+    Gives doc an empty numbering part if the template has none, so list styles and
+    restarted lists have somewhere to put their definitions.
+    """
+    if any(rel.reltype == RT.NUMBERING for rel in doc.part.rels.values()):
+        return
+    element = copy.deepcopy(Document().part.numbering_part.element)
+    for child in list(element):
+        element.remove(child)
+    part = NumberingPart(PackURI("/word/numbering.xml"), CT.WML_NUMBERING, element, doc.part.package)
+    doc.part.relate_to(part, RT.NUMBERING)
+
+
+def _merge_default_styles(doc):
+    """
+    Copies REQUIRED_STYLES missing from doc, and the styles they are based on or
+    linked to, from python-docx's default template. List styles bring their
+    numbering definitions along. Returns the names of the styles added.
+    """
+    default = Document()
+    present = {style.name for style in doc.styles}
+    default_styles = {style.style_id: style.element for style in default.styles}
+    present_ids = {style.style_id for style in doc.styles}
+
+    wanted, queue = [], [default.styles[name].style_id for name in REQUIRED_STYLES if name not in present]
+    while queue:
+        style_id = queue.pop(0)
+        if style_id in present_ids or style_id in wanted or style_id not in default_styles:
+            continue
+        wanted.append(style_id)
+        for reference in ("basedOn", "next", "link"):
+            element = default_styles[style_id].find(W + reference)
+            if element is not None:
+                queue.append(element.get(W + "val"))
+    if not wanted:
+        return []
+
+    styles_element = doc.styles.element
+    numbering = doc.part.numbering_part.element
+    default_numbering = default.part.numbering_part.element
+    next_abstract_id = max([int(a.get(W + "abstractNumId")) for a in numbering.findall(W + "abstractNum")] + [-1]) + 1
+    added = []
+    for style_id in wanted:
+        style = copy.deepcopy(default_styles[style_id])
+        num_id = style.find(f"{W}pPr/{W}numPr/{W}numId")
+        if num_id is not None:
+            default_num = default_numbering.num_having_numId(int(num_id.get(W + "val")))
+            abstract = copy.deepcopy(next(
+                a for a in default_numbering.findall(W + "abstractNum")
+                if a.get(W + "abstractNumId") == str(default_num.abstractNumId.val)))
+            abstract.set(W + "abstractNumId", str(next_abstract_id))
+            # abstractNum definitions have to come before the num instances
+            first_num = numbering.find(W + "num")
+            if first_num is not None:
+                first_num.addprevious(abstract)
+            else:
+                numbering.append(abstract)
+            num_id.set(W + "val", str(numbering.add_num(next_abstract_id).numId))
+            next_abstract_id += 1
+        styles_element.append(style)
+        added.append(style.find(W + "name").get(W + "val"))
+    return added
+
+
+def build_base(path=BRAND_TEMPLATE_PATH):
+    """The stripped, style-complete template as .docx bytes."""
+    doc = Document(path)
+    _strip_content(doc)
+    _ensure_numbering(doc)
+    added = _merge_default_styles(doc)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    print(f"Branded base built from {os.path.basename(path)}: {len(buffer.getvalue())} bytes"
+          + (f", added styles: {', '.join(added)}" if added else ""))
+    return buffer.getvalue()
+
+
+def base_bytes(path=BRAND_TEMPLATE_PATH):
+    """The cached base for path, rebuilt when the template file changes."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+    with _bases_lock:
+        if key not in _bases:
+            _bases[key] = build_base(path)
+        return _bases[key]
+
+
+def new_document(path=BRAND_TEMPLATE_PATH):
+    """A new Document cloned from the branded base, or a blank one if there is no template."""
+    if not path or not os.path.exists(path):
+        return Document()
+    try:
+        return Document(io.BytesIO(base_bytes(path)))
+    except Exception as e:
+        print(f"Could not build the branded base from {path}, using a blank document: {e}")
+        return Document()
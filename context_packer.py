@@ -0,0 +1,94 @@
+# context_packer.py
+import hashlib
+import re
+import threading
+from functools import lru_cache
+
+import tiktoken
+
+# Tokenizer of the completion model
+TOKENIZER_MODEL = "gpt-4o-mini"
+
+# Template context allowed in the prompt, per agent type
+CONTEXT_TOKEN_BUDGETS = {
+    "brand": 1500,
+    "digital": 3000,
+}
+
+# Tokens taken by the "\n\n" between chunks
+SEPARATOR_TOKENS = 1
+
+# Chunks sharing this fraction of their word 5-grams with a selected chunk are dropped
+OVERLAP_THRESHOLD = 0.8
+
+
+_encoding_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _load_encoding():
+    try:
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except Exception as e:
+        # The encoding file could not be downloaded: fall back to a characters-per-token estimate
+        print(f"WARNING: tokenizer unavailable ({e}), estimating token counts")
+        return None
+
+
+def get_encoding():
+    # Loaded once even when several section threads ask for it at the same time
+    with _encoding_lock:
+        return _load_encoding()
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _shingles(text, size=5):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def pack_context(hits, agent_type, budget=None):
+    """
+    Fills the agent type's token budget with the highest scoring chunks.
+
+    hits: [{"id", "text", "metadata", "score"}], any order, higher score is better.
+    Exact duplicates and chunks mostly contained in an already selected chunk are
+    skipped; a chunk that does not fit is skipped so smaller ones can still be used.
+    Returns (context, included) where included records each chunk that went in.
+    """
+    budget = CONTEXT_TOKEN_BUDGETS.get(agent_type, 2000) if budget is None else budget
+    selected, seen_hashes, selected_shingles = [], set(), []
+    used = 0
+    for hit in sorted(hits, key=lambda hit: -hit["score"]):
+        text = hit["text"].strip()
+        digest = hashlib.sha256(" ".join(text.split()).lower().encode("utf-8")).hexdigest()
+        if not text or digest in seen_hashes:
+            continue
+        shingles = _shingles(text)
+        if any(len(shingles & other) / len(shingles) >= OVERLAP_THRESHOLD for other in selected_shingles):
+            continue
+        tokens = count_tokens(text) + (SEPARATOR_TOKENS if selected else 0)
+        if used + tokens > budget:
+            continue
+        used += tokens
+        seen_hashes.add(digest)
+        selected_shingles.append(shingles)
+        selected.append((hit, text, tokens))
+
+    context = "\n\n".join(text for _, text, _ in selected)
+    included = [{
+        "id": hit["id"],
+        "heading_path": (hit.get("metadata") or {}).get("heading_path", ""),
+        "score": round(float(hit["score"]), 6),
+        "tokens": tokens,
+    } for hit, _, tokens in selected]
+    return context, included
@@ -0,0 +1,132 @@
+# embedding_cache.py
+import hashlib
+import os
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are not locked across processes
+    fcntl = None
+
+CACHE_DIR = "./embedding_cache"
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed store of embeddings for one model.
+
+    Vectors are appended as raw float32 rows to <model>.f32 and read back through a
+    memory map; <model>.idx holds one "sha256 row" line per vector. Both files are
+    append-only, so a rebuild, a collection swap or a new chunking setting reuses
+    every vector whose text was embedded before.
+    """
+
+    def __init__(self, model_name, cache_dir=CACHE_DIR):
+        self.model_name = model_name
+        os.makedirs(cache_dir, exist_ok=True)
+        filename = model_name.replace("/", "__")
+        self.vectors_path = os.path.join(cache_dir, f"{filename}.f32")
+        self.index_path = os.path.join(cache_dir, f"{filename}.idx")
+        self.dim = None
+        self.rows = {}  # sha256 -> row
+        self._vectors = None
+        self._index_offset = 0
+        self.hits = 0
+        self.misses = 0
+        self._refresh()
+
+    def _refresh(self):
+        """Reads index lines appended since the last refresh (possibly by another process)."""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written line, picked up next time
+                self._index_offset += len(line)
+                key, value = line.decode("ascii").split()
+                if key == "dim":
+                    self.dim = int(value)
+                else:
+                    self.rows[key] = int(value)
+        self._vectors = None
+
+    def _matrix(self):
+        if self._vectors is None and self.dim and os.path.exists(self.vectors_path):
+            n_rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+            if not n_rows:
+                return None
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim))
+        return self._vectors
+
+    def get_many(self, hashes):
+        """Returns a vector (float32 array) or None for every hash."""
+        matrix = self._matrix()
+        found = []
+        for sha256 in hashes:
+            row = self.rows.get(sha256)
+            if row is None or matrix is None or row >= matrix.shape[0]:
+                found.append(None)
+            else:
+                found.append(np.array(matrix[row]))
+        return found
+
+    def put_many(self, hashes, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        with open(self.index_path, "a", encoding="ascii", newline="\n") as index:
+            if fcntl:
+                fcntl.flock(index, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if self.dim is None:
+                    self.dim = vectors.shape[1]
+                    index.write(f"dim {self.dim}\n")
+                elif vectors.shape[1] != self.dim:
+                    raise ValueError(f"Embedding size {vectors.shape[1]} does not match cache dimension {self.dim}")
+                with open(self.vectors_path, "ab") as f:
+                    row_bytes = self.dim * 4
+                    size = f.seek(0, os.SEEK_END)
+                    if size % row_bytes:
+                        # A crash mid-append left a partial row (never indexed); drop it
+                        # so the rows appended from now on stay aligned
+                        size -= size % row_bytes
+                        f.truncate(size)
+                    first_row = size // row_bytes
+                    f.write(vectors.tobytes())
+                lines = [f"{sha256} {first_row + i}\n" for i, sha256 in enumerate(hashes)]
+                index.write("".join(lines))
+                index.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(index, fcntl.LOCK_UN)
+        self._refresh()
+
+    def embed(self, texts, embedding_function):
+        """Returns embeddings for texts, running embedding_function only on cache misses."""
+        hashes = [text_sha256(text) for text in texts]
+        vectors = self.get_many(hashes)
+        if any(vector is None for vector in vectors):
+            # Another process may have added them since our last read
+            self._refresh()
+            vectors = self.get_many(hashes)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            # Identical texts in one call are embedded once
+            unique = list(dict.fromkeys(hashes[i] for i in missing))
+            text_by_hash = {hashes[i]: texts[i] for i in missing}
+            computed = np.asarray(embedding_function([text_by_hash[h] for h in unique]), dtype=np.float32)
+            self.put_many(unique, computed)
+            by_hash = dict(zip(unique, computed))
+            for i in missing:
+                vectors[i] = by_hash[hashes[i]]
+        return vectors
@@ -0,0 +1,104 @@
+# embeddings.py
+import os
+import threading
+from abc import ABC, abstractmethod
+
+# Defaults, overridden by EMBEDDING_MODEL / EMBEDDING_BACKEND / EMBEDDING_ONNX_FILE in .env
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# "sentence-transformers" (PyTorch) or "onnx" (onnxruntime, int8-quantized weights on CPU)
+DEFAULT_EMBEDDING_BACKEND = "sentence-transformers"
+# Quantized export shipped in the sentence-transformers model repos
+DEFAULT_ONNX_FILE = "onnx/model_qint8_avx2.onnx"
+
+
+class Embedder(ABC):
+    """
+    One loaded embedding model, used for both indexing and queries.
+    Queries pass its vectors to collection.query(query_embeddings=...), so Chroma never
+    loads its own default model. `name` identifies the vectors it produces (index
+    stamp and cache key).
+    """
+    backend = None
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.name = model_name
+
+    def __call__(self, input):
+        return list(self.embed(list(input)))
+
+    @abstractmethod
+    def embed(self, texts):
+        """Returns a float32 array of shape (len(texts), dim)."""
+
+
+class SentenceTransformerEmbedder(Embedder):
+    backend = "sentence-transformers"
+
+    def __init__(self, model_name, **model_kwargs):
+        super().__init__(model_name)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, **model_kwargs)
+
+    def embed(self, texts):
+        return self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+
+
+class OnnxEmbedder(SentenceTransformerEmbedder):
+    """int8-quantized ONNX export run through onnxruntime (needs optimum[onnxruntime])."""
+    backend = "onnx"
+
+    def __init__(self, model_name, file_name=None):
+        file_name = file_name or os.getenv("EMBEDDING_ONNX_FILE", DEFAULT_ONNX_FILE)
+        super().__init__(model_name, backend="onnx", model_kwargs={"file_name": file_name})
+        # Quantized vectors differ slightly from the PyTorch ones, index and cache them apart
+        self.name = f"{model_name}-onnx-{os.path.splitext(os.path.basename(file_name))[0]}"
+
+
+EMBEDDERS = {
+    SentenceTransformerEmbedder.backend: SentenceTransformerEmbedder,
+    OnnxEmbedder.backend: OnnxEmbedder,
+}
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """Loads the configured embedder once per process and warms it up."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            backend = os.getenv("EMBEDDING_BACKEND", DEFAULT_EMBEDDING_BACKEND)
+            model_name = os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+            if backend not in EMBEDDERS:
+                raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}. Must be one of {', '.join(EMBEDDERS)}")
+            print(f"Loading {backend} embedder: {model_name}")
+            embedder = EMBEDDERS[backend](model_name)
+            # The first forward pass allocates buffers, don't charge it to a user query
+            embedder.embed(["warm up"])
+            _embedder = embedder
+    return _embedder
+
+
+def check_index_model(collection, embedder):
+    """
+    Stamps an empty collection with the embedder's name and refuses to use a
+    collection that was indexed with a different model.
+    """
+    metadata = dict(collection.metadata or {})
+    indexed_with = metadata.get("embedding_model")
+    if indexed_with is None:
+        # Collections created before the stamp were indexed with all-MiniLM-L6-v2
+        if collection.count() > 0 and embedder.name != DEFAULT_EMBEDDING_MODEL:
+            indexed_with = DEFAULT_EMBEDDING_MODEL
+        else:
+            metadata["embedding_model"] = embedder.name
+            collection.modify(metadata=metadata)
+            return
+    if indexed_with != embedder.name:
+        raise RuntimeError(
+            f"Collection '{collection.name}' was indexed with '{indexed_with}' but queries would use "
+            f"'{embedder.name}'. Set EMBEDDING_MODEL/EMBEDDING_BACKEND to match, or delete ./chroma_db "
+            f"and ./chroma_manifest.json to re-index."
+        )
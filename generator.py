@@ -6,6 +6,7 @@ import openai
 from docx import Document
 import io
 from datetime import datetime
+from ingestion import sync_templates
 
 # Initialize OpenAI
 from dotenv import load_dotenv
@@ -21,37 +22,21 @@ embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
     model_name="all-MiniLM-L6-v2"
 )
 
-def extract_text_from_docx(filepath):
-    try:
-        doc = Document(filepath)
-        return "\n".join(para.text for para in doc.paragraphs if para.text.strip())
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""  # Or handle the error as needed
+# Sync template documents into Chroma (only changed chunks are re-embedded)
+LEGACY_TEMPLATE_FILES = {
+    "brand_guideline_template": "Brand Guideline.docx",
+    "digital_strategy_template": "Digital Strategy.docx",
+    "digital_strategy_example": "Digital Strategy Example.docx",
+}
+# The legacy template types share the collection with generator2's, so they keep their own manifest
+LEGACY_MANIFEST_PATH = "./chroma_manifest_legacy.json"
 
-# Load template documents into Chroma (only once)
 def load_templates():
-    if collection.count() > 0:
-        return
-
-    brand_template = extract_text_from_docx("Brand Guideline.docx")
-    digital_template = extract_text_from_docx("Digital Strategy.docx")
-    digital_example = extract_text_from_docx("Digital Strategy Example.docx")
-
-    texts = [brand_template, digital_template, digital_example]
-    metadatas = [
-        {"type": "brand_guideline_template"},
-        {"type": "digital_strategy_template"},
-        {"type": "digital_strategy_example"}
-    ]
-    ids = ["brand_template", "digital_template", "digital_example"]
-
-    collection.add(
-        documents=texts,
-        metadatas=metadatas,
-        ids=ids,
-        embeddings=embedding_function(texts)
-    )
+    summary = sync_templates(collection, embedding_function, templates=LEGACY_TEMPLATE_FILES,
+                             manifest_path=LEGACY_MANIFEST_PATH)
+    if summary["upserted"] or summary["moved"] or summary["deleted"]:
+        print(f"Templates synced: {summary['upserted']} chunks upserted, {summary['moved']} moved, "
+              f"{summary['deleted']} deleted.")
 
 # RAG Retrieval
 def retrieve_context(query, agent_type):
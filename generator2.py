@@ -1,111 +1,253 @@
 import os
 import chromadb
-from chromadb.utils import embedding_functions
-import openai
-from docx import Document
 import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-
-# Initialize OpenAI
+from embedding_cache import EmbeddingCache
+from embeddings import check_index_model, get_embedder
+from ingestion import LIBRARY_PROGRESS_PATH, TEMPLATE_FILES, manifest_version, reset_manifest, sync_templates
+from context_packer import count_tokens, pack_context
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from branded_base import new_document
+from markdown_docx import render_markdown
+from llm_client import LLMClient, usage_tokens
+from response_cache import ResponseCache, normalize_answers
+from outlines import (HEADING_RE, SECTION_OUTLINES, check_draft, impacted_sections, normalize_section, outline_prompt,
+                      section_answers, splice_sections, stitch_sections)
+from section_routing import CHUNKS_PER_SECTION, build_routing_table, load_routing_table, routed_hits, routing_version
+from vector_index import NumpyVectorIndex
+
+# Settings from .env
 from dotenv import load_dotenv
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# Shared completion client: pooled connections, rate limits, retries and deadlines (see llm_client.py)
+llm = LLMClient.from_env()
+
+# Embedding model, shared by indexing and retrieval
+embedder = get_embedder()
 
 # Initialize ChromaDB
 client = chromadb.PersistentClient(path="./chroma_db")
 collection = client.get_or_create_collection(name="marketing_templates")
+check_index_model(collection, embedder)
+
+# Retrieval backend: "chroma" (default) or "numpy" (in-process exact search, see vector_index.py)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+if RETRIEVAL_BACKEND not in ("chroma", "numpy"):
+    raise ValueError(f"Unknown RETRIEVAL_BACKEND: {RETRIEVAL_BACKEND}. Must be 'chroma' or 'numpy'")
+vector_index = NumpyVectorIndex() if RETRIEVAL_BACKEND == "numpy" else None
+
+# Retrieval mode: "dense" (embeddings only) or "hybrid" (BM25 + embeddings, fused by rank)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+if RETRIEVAL_MODE not in ("dense", "hybrid"):
+    raise ValueError(f"Unknown RETRIEVAL_MODE: {RETRIEVAL_MODE}. Must be 'dense' or 'hybrid'")
+lexical_index = BM25Index() if RETRIEVAL_MODE == "hybrid" else None
+
+# Vectors already computed for a text are reused across rebuilds
+embedding_cache = EmbeddingCache(embedder.name)
+
+def embed_documents(texts):
+    return embedding_cache.embed(texts, embedder.embed)
+
+# Drafts generated concurrently (batch runs, job workers) sync one at a time
+templates_lock = threading.Lock()
+# Template files and collection size at the last sync; while they match nothing is checked again
+synced_templates_state = None
+# The synced_templates_state the routing table was last checked against
+routing_synced_state = None
+
+def templates_state():
+    files = []
+    for filepath in TEMPLATE_FILES.values():
+        try:
+            stat = os.stat(filepath)
+            files.append((filepath, stat.st_mtime, stat.st_size))
+        except OSError:
+            files.append((filepath, None, None))
+    return tuple(files), collection.count()
+
+# Sync template documents into Chroma (only changed chunks are re-embedded)
+def load_templates():
+    global synced_templates_state
+    if templates_state() == synced_templates_state:
+        return
+    with templates_lock:
+        if templates_state() == synced_templates_state:
+            return
+        summary = sync_templates(collection, embed_documents)
+        if summary["upserted"] or summary["moved"] or summary["deleted"]:
+            print(f"Templates synced: {summary['upserted']} chunks upserted, {summary['moved']} moved, "
+                  f"{summary['deleted']} deleted. "
+                  f"Total count: {collection.count()}")
+        else:
+            print(f"Templates up to date. Count: {collection.count()}")
+        sync_indexes(force=bool(summary["upserted"] or summary["moved"] or summary["deleted"]))
+        synced_templates_state = templates_state()
+
+def sync_indexes(force=False):
+    """Rebuilds the in-process NumPy/BM25 indexes from the collection when they are stale."""
+    stale = [index for index in (vector_index, lexical_index)
+             if index is not None and (force or index.count() != collection.count())]
+    if not stale:
+        return
+    include = ["documents", "metadatas"]
+    if vector_index in stale:
+        include.append("embeddings")
+    data = collection.get(include=include)
+    for index in stale:
+        index.build_from_collection(collection, data)
+
+# Chunks retrieved per query before the context packer applies the token budget
+N_RETRIEVAL_CANDIDATES = 20
+
+# Template types each agent retrieves from
+AGENT_TEMPLATE_TYPES = {
+    "brand": ["brand_template"],
+    "digital": ["digital_template", "digital_example"],
+}
 
-# Embedding function
-embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-MiniLM-L6-v2"
-)
+# Retrieval queries: "combined" (all answers as one query) or "per_answer"
+# (each answer is its own query, rankings fused per answer)
+RETRIEVAL_QUERIES = os.getenv("RETRIEVAL_QUERIES", "combined")
+if RETRIEVAL_QUERIES not in ("combined", "per_answer"):
+    raise ValueError(f"Unknown RETRIEVAL_QUERIES: {RETRIEVAL_QUERIES}. Must be 'combined' or 'per_answer'")
 
-def extract_text_from_docx(filepath):
-    try:
-        doc = Document(filepath)
-        return "\n".join(para.text for para in doc.paragraphs if para.text.strip())
-    except Exception as e:
-        print(f"Error reading {filepath}: {e}")
-        return ""
+def answer_queries(answers):
+    """One retrieval query per non-empty answer, prefixed with its question id."""
+    return [f"{question_id.replace('_', ' ')}: {answer.strip()}"
+            for question_id, answer in answers.items() if answer and answer.strip()]
 
-# Load template documents into Chroma (only once)
-def load_templates():
-    if collection.count() > 0:
-        print(f"Templates already loaded. Count: {collection.count()}")
-        return
+def search_chunks(queries, agent_type, n_results=N_RETRIEVAL_CANDIDATES):
+    """
+    Returns [{"id", "text", "metadata", "score"}] for the best matching template
+    chunks, best first. queries is a string or a list of strings; all of them are
+    embedded in one batch and searched together. With a single dense ranking the
+    score is the negated distance, otherwise the rankings are fused with RRF.
+    """
+    if isinstance(queries, str):
+        queries = [queries]
+    template_types = AGENT_TEMPLATE_TYPES[agent_type]
+    if len(template_types) == 1:
+        where_clause = {"type": template_types[0]}
+    else:
+        where_clause = {"type": {"$in": template_types}}
 
-    print("Loading templates into ChromaDB...")
-    
-    brand_template = extract_text_from_docx("Brand Guideline.docx")
-    digital_template = extract_text_from_docx("Digital Strategy.docx")
-    digital_example = extract_text_from_docx("Digital Strategy Example.docx")
-
-    # Verify content was extracted
-    if not brand_template:
-        print("WARNING: Brand template is empty!")
-    if not digital_template:
-        print("WARNING: Digital template is empty!")
-    if not digital_example:
-        print("WARNING: Digital example is empty!")
-
-    texts = [brand_template, digital_template, digital_example]
-    metadatas = [
-        {"type": "brand_template"},
-        {"type": "digital_template"},
-        {"type": "digital_example"}
-    ]
-    ids = ["brand_template", "digital_template", "digital_example"]
-
-    collection.add(
-        documents=texts,
-        metadatas=metadatas,
-        ids=ids,
-        embeddings=embedding_function(texts)
+    search_index = vector_index if vector_index is not None else collection
+    results = search_index.query(
+        query_embeddings=embedder(queries),
+        n_results=n_results,
+        where=where_clause
     )
-    
-    print(f"Templates loaded successfully. Total count: {collection.count()}")
-
-# RAG Retrieval
-def retrieve_context(query, agent_type):
+    by_id, rankings = {}, []
+    for ids, documents, metadatas, distances in zip(
+            results['ids'], results['documents'], results['metadatas'], results['distances']):
+        for chunk_id, document, metadata, distance in zip(ids, documents, metadatas, distances):
+            by_id.setdefault(chunk_id, {"id": chunk_id, "text": document, "metadata": metadata, "score": -distance})
+        rankings.append(ids)
+
+    if lexical_index is not None:
+        # Exact terms (competitor names, acronyms, channels) from BM25, fused with dense ranks
+        lexical = lexical_index.query(queries, n_results=n_results, where=where_clause)
+        for ids, documents, metadatas in zip(lexical['ids'], lexical['documents'], lexical['metadatas']):
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                by_id.setdefault(chunk_id, {"id": chunk_id, "text": document, "metadata": metadata})
+            rankings.append(ids)
+
+    if len(rankings) == 1:
+        return [by_id[chunk_id] for chunk_id in rankings[0]]
+    fused = reciprocal_rank_fusion(rankings)
+    return [dict(by_id[chunk_id], score=score) for chunk_id, score in fused[:n_results]]
+
+def assemble_context(queries, agent_type):
     """
-    agent_type should be either 'brand' or 'digital'
+    Retrieves template chunks for the query (or list of queries) and packs them into
+    the agent's token budget. Returns (context, included_chunks).
     """
     print(f"Retrieving context for agent_type: {agent_type}")
-    
-    # Map agent type to template types
-    if agent_type == "digital":
-        where_clause = {"type": {"$in": ["digital_template", "digital_example"]}}
-    elif agent_type == "brand":
-        where_clause = {"type": "brand_template"}
-    else:
+    if agent_type not in AGENT_TEMPLATE_TYPES:
         print(f"Unknown agent_type: {agent_type}")
-        return ""
+        return "", []
 
     try:
-        results = collection.query(
-            query_texts=[query],
-            n_results=3,
-            where=where_clause
-        )
-        
-        docs = results['documents'][0] if results['documents'] else []
-        print(f"Retrieved {len(docs)} documents")
-        
-        if docs:
-            context = "\n\n".join(docs)
-            print(f"Context length: {len(context)} characters")
-            return context
-        else:
-            print("No documents retrieved!")
-            return ""
-            
+        hits = search_chunks(queries, agent_type)
     except Exception as e:
         print(f"Error during retrieval: {e}")
-        return ""
+        return "", []
+
+    context, included = pack_context(hits, agent_type)
+    print(f"Retrieved {len(hits)} template sections, packed {len(included)} "
+          f"({sum(chunk['tokens'] for chunk in included)} tokens)")
+    if not included:
+        print("No documents retrieved!")
+    return context, included
+
+# Context source: "retrieval" (queries built from the answers at request time) or
+# "routed" (each outline section's chunks, looked up in the precomputed routing table)
+CONTEXT_SOURCE = os.getenv("CONTEXT_SOURCE", "retrieval")
+if CONTEXT_SOURCE not in ("retrieval", "routed"):
+    raise ValueError(f"Unknown CONTEXT_SOURCE: {CONTEXT_SOURCE}. Must be 'retrieval' or 'routed'")
+
+routing_table = load_routing_table()
+
+def sync_routing_table():
+    """Rebuilds the section routing table when templates, outlines or retrieval settings changed."""
+    global routing_table
+    section_queries = {agent_type: [(section["title"], section["query"]) for section in outline]
+                       for agent_type, outline in SECTION_OUTLINES.items()}
+    version = routing_version(manifest_version(), collection.count(), section_queries,
+                              embedder.name, RETRIEVAL_MODE, CHUNKS_PER_SECTION)
+    if routing_table and routing_table.get("version") == version:
+        return
+    routing_table = build_routing_table(
+        SECTION_OUTLINES,
+        lambda agent_type, queries, n_results: [search_chunks(query, agent_type, n_results) for query in queries],
+        version,
+    )
+    print(f"Section routing table rebuilt: "
+          f"{sum(len(sections) for sections in routing_table['sections'].values())} sections")
+
+def ensure_routing_table():
+    """
+    Syncs the routing table on first use after the templates changed, so modes that
+    never build a section or routed prompt never pay for it.
+    """
+    global routing_synced_state
+    if routing_synced_state is not None and routing_synced_state == synced_templates_state:
+        return
+    with templates_lock:
+        if routing_synced_state is None or routing_synced_state != synced_templates_state:
+            sync_routing_table()
+            routing_synced_state = synced_templates_state
+
+def routed_context(agent_type, titles=None):
+    """
+    Packs the chunks routed to the outline sections (all of them by default) into the
+    agent's token budget, without any retrieval call. Returns (context, included_chunks).
+    """
+    hits = routed_hits(routing_table, agent_type, titles)
+    context, included = pack_context(hits, agent_type)
+    print(f"Routed {len(hits)} template sections, packed {len(included)} "
+          f"({sum(chunk['tokens'] for chunk in included)} tokens)")
+    return context, included
+
+# RAG Retrieval
+def retrieve_context(query, agent_type):
+    """
+    agent_type should be either 'brand' or 'digital'
+    """
+    context, _ = assemble_context(query, agent_type)
+    return context
 
 # Supercharged Prompt Templates
+# Each prompt has three parts so the static part can be sent first, unchanged between
+# requests, as the system message: "instructions" (role, outline and rules),
+# "context" (template context) and "input" (the client's answers).
 PROMPT_TEMPLATES = {
-    "brand": """
+    "brand": {
+        "instructions": """
 You are a senior brand strategist at LFTFIELD, a premium marketing agency. 
 Your task is to generate a **Brand Strategy & Guideline Document** based on the client inputs.
 
@@ -113,154 +255,274 @@ Your task is to generate a **Brand Strategy & Guideline Document** based on the
 
 REQUIRED SECTIONS (DO NOT SKIP ANY):
 
-# Company Description
-[Detailed overview of the company, its background, industry position, and what they do]
-
-# Brand Wheel
-One essential part of the brand development process is the "brand wheel," a templated approach to understanding your brand by breaking it down into five categories:
-
-## Attributes
-[List 3-5 key brand attributes]
-
-## Benefits
-[List 3-5 benefits the brand provides to customers]
-
-## Values
-[List 3-5 core brand values]
-
-## Personality
-[List 3-5 personality traits of the brand]
-
-## Essence
-[Single phrase or word that captures the brand essence]
+""" + outline_prompt("brand") + """
 
-# Audience Personas
-Your Audience Personas should epitomize your customer base. These fictional profiles will help to ensure your brand and marketing efforts will appeal to your audience.
-
-[Create 2-3 detailed personas with:]
-- Demographics (age, education, location, income)
-- Background
-- Goals
-- Challenges
-- Motivations
-
-# Competitor Research
-Profiling your competitors gives people a unique insight into your industry. 
-
-[Analyze 2-3 key competitors:]
-- Company name and overview
-- What they offer
-- Their strengths
-- Key learnings
-
-# Brand Positioning
-Brand positioning is the process of placing your brand in the minds of your customers.
+---
 
-**Using the following formula:** [Brand Name]'s [offering] is the only [category/service/product] that [benefit you bring to your customers].
+**FINAL INSTRUCTIONS:**
+1. You MUST include ALL sections listed above - no exceptions
+2. Follow the exact heading structure (# for main sections, ## for subsections)
+3. Provide substantial content for each section - not just placeholders
+4. Use professional, strategic language
+5. Base all content on the client input provided
+6. Output ONLY the completed document in Markdown format
+7. Do NOT add any preamble or explanation - start directly with "# Company Description"
+""",
+        "context": """
+---
 
-[Write the positioning statement]
+Retrieved Template Context for Reference:
+{context}
+""",
+        "input": """
+Client Input:
+{input}
 
-# Brand Story
-Your Brand Story is unique to you -- it can be funny, unexpected, serious, ambitious... but one thing is for sure: it must spark an emotional reaction. Include the direct pain points that you solve for customers.
+---
 
-[Write a compelling 2-3 paragraph brand story]
+BEGIN OUTPUT NOW:
+""",
+    },
 
-# Brand Values
-You will find your Brand Values at the core of your Brand Strategy. State each value with a descriptive sentence. Avoid clichés like "transparent" and "honest."
+    "digital": {
+        "instructions": """
+You are a senior digital strategist at LFTFIELD. 
+Generate a **Comprehensive Digital Marketing Strategy** using the Flywheel Framework (Attract → Engage → Delight).
 
-[List 3-5 values with descriptions]
+**IMPORTANT**: Use the retrieved template context (especially the MMTTC example) as your PRIMARY reference for structure, depth, and quality.
 
-# Brand Mission
-Detail exactly where your brand is going and what you want to achieve.
+**Required Structure:**
+""" + outline_prompt("digital") + """
 
-[Write mission statement as a paragraph]
+Use professional, data-driven language. Be specific and actionable.
+Output in clean Markdown with clear headings and bullet points.
+""",
+        "context": """
+Retrieved Template Context:
+{context}
+""",
+        "input": """
+Now, using the structure and quality standards from the examples above, create a complete digital strategy for this client:
 
-# Brand Touchpoints
-A Brand Touch Point is the time and place where a customer comes in contact with your brand.
+Client Input:
+{input}
+""",
+    },
+}
 
-[List and describe 5-8 touchpoints where customers interact with the brand]
+# Completion settings
+COMPLETION_MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.3
+MAX_TOKENS = {"brand": 6000, "digital": 4000}
 
-# Brand Messaging
-Your Brand Messaging is "what" you're trying to communicate and how you communicate it.
+# Per-section prompts for GENERATION_MODE=sections; each section is written on its own
+SECTION_PROMPT_TEMPLATES = {
+    "brand": {
+        "instructions": """
+You are a senior brand strategist at LFTFIELD, a premium marketing agency. 
+You are writing ONE section of a **Brand Strategy & Guideline Document** based on the client inputs. The other sections are written separately, so cover only this one.
 
-[List 3-5 key messages]
-[Optional: Break down into brand pillars]
+SECTION: # {title}
 
-# Tone of Voice
-Your Tone of Voice describes how your brand communicates with the audience and thus influences how people perceive your messaging.
+{instructions}
 
-Create a table with:
-| Characteristic | Description | Do's | Don'ts |
-[Fill in 3-5 rows]
+---
 
+**FINAL INSTRUCTIONS:**
+1. Start directly with "# {title}" - no preamble or explanation
+2. Use ## for subsections
+3. Provide substantial content - not just placeholders
+4. Use professional, strategic language
+5. Base all content on the client input provided
+6. Output ONLY this section in Markdown format
+""",
+        "context": """
 ---
 
 Retrieved Template Context for Reference:
 {context}
-
----
-
+""",
+        "input": """
 Client Input:
 {input}
 
 ---
 
-**FINAL INSTRUCTIONS:**
-1. You MUST include ALL sections listed above - no exceptions
-2. Follow the exact heading structure (# for main sections, ## for subsections)
-3. Provide substantial content for each section - not just placeholders
-4. Use professional, strategic language
-5. Base all content on the client input provided
-6. Output ONLY the completed document in Markdown format
-7. Do NOT add any preamble or explanation - start directly with "# Company Description"
-
 BEGIN OUTPUT NOW:
 """,
+    },
 
-    "digital": """
+    "digital": {
+        "instructions": """
 You are a senior digital strategist at LFTFIELD. 
-Generate a **Comprehensive Digital Marketing Strategy** using the Flywheel Framework (Attract → Engage → Delight).
+You are writing ONE section of a **Comprehensive Digital Marketing Strategy** that uses the Flywheel Framework (Attract → Engage → Delight). The other sections are written separately, so cover only this one.
+
+Use the retrieved template context (especially the MMTTC example) as your PRIMARY reference for structure, depth, and quality.
 
-**IMPORTANT**: Use the retrieved context below (especially the MMTTC example) as your PRIMARY reference for structure, depth, and quality.
+**Section to write:** # {title}
+{instructions}
 
+Start directly with "# {title}" and use ## for each subsection.
+Use professional, data-driven language. Be specific and actionable.
+Output in clean Markdown with clear headings and bullet points.
+""",
+        "context": """
 Retrieved Template Context:
 {context}
+""",
+        "input": """
+Client Input:
+{input}
+""",
+    },
+}
 
----
+# Generation mode: "single" (one completion for the whole document) or "sections"
+# (one completion per outline section, run concurrently and stitched in outline order)
+GENERATION_MODE = os.getenv("GENERATION_MODE", "single")
+if GENERATION_MODE not in ("single", "sections"):
+    raise ValueError(f"Unknown GENERATION_MODE: {GENERATION_MODE}. Must be 'single' or 'sections'")
 
-Now, using the structure and quality standards from the examples above, create a complete digital strategy for this client:
+# Section completions running at the same time
+SECTION_WORKERS = int(os.getenv("SECTION_WORKERS", "4"))
 
-Client Input:
-{input}
+# Completion and routed-context token limits per section
+SECTION_MAX_TOKENS = {"brand": 1200, "digital": 2000}
+SECTION_CONTEXT_TOKENS = 800
 
-**Required Structure:**
-1. INTRODUCTION
-   - Company Background
-   - Products & Services
-   - Marketing Goals (SMART format)
-
-2. RESEARCH & ANALYSIS
-   - SWOT Analysis
-   - Competitive Analysis
-   - Target Customers (detailed personas)
-   - Buying Cycle
-   - Unique Selling Proposition
-   - Brand Relevance
-
-3. OUR STRATEGY
-   - Proposed Strategy (Flywheel: Attract/Engage/Delight)
-   - Preliminary Projects
-   - Key Performance Indicators (by channel)
-   - Marketing Channels
-
-4. THE ROAD AHEAD
-   - Summary
-   - Next Steps
+# Check finished drafts against the outline and rewrite missing, empty or cut-off sections
+REPAIR_DRAFTS = os.getenv("REPAIR_DRAFTS", "1") != "0"
 
-Use professional, data-driven language. Be specific and actionable.
-Output in clean Markdown with clear headings and bullet points.
-"""
-}
+# Compiled prompts: the static system message per agent type (and per section), with
+# its token count, built once per routing table version. Requests that share it send
+# an identical prefix, which the provider can serve from its prompt cache.
+compiled_prompts = {}
+compiled_prompts_lock = threading.Lock()
+
+def compile_prompt(agent_type, section=None):
+    """
+    The static system message for a whole-document prompt, or for one outline section:
+    instructions and outline, plus the template context when it does not depend on the
+    answers (routed context, and always for sections).
+    Returns {"system", "system_tokens", "context_chunks", "static_context"}.
+    """
+    if agent_type not in PROMPT_TEMPLATES:
+        raise ValueError(f"Unknown agent_type: {agent_type}. Must be 'brand' or 'digital'")
+    # Section prompts (sections mode, repairs and updates) and routed context read the routing table
+    if section or CONTEXT_SOURCE == "routed":
+        ensure_routing_table()
+    key = (agent_type, section["title"] if section else None, CONTEXT_SOURCE, (routing_table or {}).get("version"))
+    with compiled_prompts_lock:
+        if key in compiled_prompts:
+            return compiled_prompts[key]
+    
+    if section:
+        template = SECTION_PROMPT_TEMPLATES[agent_type]
+        instructions = template["instructions"].format(title=section["title"], instructions=section["instructions"])
+        hits = routed_hits(routing_table, agent_type, [section["title"]])
+        context, context_chunks = pack_context(hits, agent_type, budget=SECTION_CONTEXT_TOKENS)
+        static_context = True
+    else:
+        template = PROMPT_TEMPLATES[agent_type]
+        instructions = template["instructions"].format()
+        static_context = CONTEXT_SOURCE == "routed"
+        context, context_chunks = routed_context(agent_type) if static_context else ("", [])
+    
+    system = instructions.strip()
+    if static_context:
+        if not context:
+            print("WARNING: No context retrieved! Output quality may be poor.")
+        system += "\n\n" + template["context"].format(context=context).strip()
+    compiled = {
+        "system": system,
+        "system_tokens": count_tokens(system),
+        "context_chunks": context_chunks,
+        "static_context": static_context,
+    }
+    with compiled_prompts_lock:
+        compiled_prompts[key] = compiled
+    print(f"Compiled {agent_type} prompt{' for ' + section['title'] if section else ''}: "
+          f"{compiled['system_tokens']} static tokens")
+    return compiled
+
+def build_messages(agent_type, compiled, input_summary, context=None, section=None):
+    """
+    The chat messages for one request: the compiled system message, then the client
+    input (and per-request context, if any) as the user message.
+    Returns (messages, prompt_tokens) with the static and variable token counts.
+    """
+    template = (SECTION_PROMPT_TEMPLATES if section else PROMPT_TEMPLATES)[agent_type]
+    parts = []
+    if context is not None:
+        parts.append(template["context"].format(context=context).strip())
+    parts.append(template["input"].format(input=input_summary).strip())
+    user = "\n\n".join(parts)
+    messages = [{"role": "system", "content": compiled["system"]}, {"role": "user", "content": user}]
+    return messages, {"static": compiled["system_tokens"], "variable": count_tokens(user)}
+
+def add_counts(total, counts):
+    """Adds token counts (prompt token estimates or usage) into a running total."""
+    for name, value in counts.items():
+        total[name] = total.get(name, 0) + value
+    return total
+
+def generate_section(agent_type, section, answers):
+    """
+    Writes one outline section from its own answers and the chunks routed to it.
+    Returns (text, context_chunks, prompt_tokens, usage, finish_reason).
+    """
+    answers = section_answers(agent_type, section, answers)
+    input_summary = "\n".join([f"Q: {q}\nA: {a}" for q, a in answers.items()])
+    compiled = compile_prompt(agent_type, section)
+    messages, prompt_tokens = build_messages(agent_type, compiled, input_summary, section=section)
+
+    response = llm.chat(
+        model=COMPLETION_MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
+        max_tokens=SECTION_MAX_TOKENS[agent_type]
+    )
+    text = response.choices[0].message.content or ""
+    finish_reason = response.choices[0].finish_reason
+    usage = usage_tokens(getattr(response, "usage", None))
+    print(f"Section '{section['title']}': {len(text)} characters, {len(compiled['context_chunks'])} context chunks, "
+          f"{usage['cached_tokens']}/{usage['prompt_tokens']} prompt tokens cached"
+          + (", cut off at max_tokens" if finish_reason == "length" else ""))
+    return text, compiled["context_chunks"], prompt_tokens, usage, finish_reason
+
+def iter_sections(agent_type, answers, outline=None):
+    """
+    Generates the outline sections (all of them by default) with at most SECTION_WORKERS
+    in flight and yields (section, text, context_chunks, prompt_tokens, usage, finish_reason) in outline
+    order, each as soon as it and every section before it are done.
+    """
+    if agent_type not in SECTION_OUTLINES:
+        raise ValueError(f"Unknown agent_type: {agent_type}. Must be 'brand' or 'digital'")
+    if outline is None:
+        outline = SECTION_OUTLINES[agent_type]
+    print(f"Generating {len(outline)} sections, {SECTION_WORKERS} at a time")
+    with ThreadPoolExecutor(max_workers=SECTION_WORKERS) as executor:
+        futures = [executor.submit(generate_section, agent_type, section, answers) for section in outline]
+        for section, future in zip(outline, futures):
+            yield (section,) + future.result()
+
+def generate_sectioned_draft(agent_type, answers):
+    """Section-parallel generate_draft_with_metadata. Returns (draft, metadata)."""
+    texts, context_chunks, prompt_tokens, usage, cut_off = [], [], {}, {}, []
+    for section, text, section_chunks, section_tokens, section_usage, finish_reason in iter_sections(
+            agent_type, answers):
+        texts.append(text)
+        if finish_reason == "length":
+            cut_off.append(section["title"])
+        context_chunks.extend(section_chunks)
+        add_counts(prompt_tokens, section_tokens)
+        add_counts(usage, section_usage)
+    draft = stitch_sections(SECTION_OUTLINES[agent_type], texts)
+    print(f"Stitched draft length: {len(draft)} characters")
+    metadata = draft_metadata(agent_type, context_chunks, prompt_tokens, usage)
+    draft = repair_draft(agent_type, draft, answers, metadata, cut_off=cut_off)
+    print("=== Generation complete ===\n")
+    return draft, metadata
 
 # Generate Draft
 def generate_draft(agent_type, answers):
@@ -268,69 +530,275 @@ def generate_draft(agent_type, answers):
     agent_type: 'brand' or 'digital'
     answers: dict of {question: answer}
     """
-    print(f"\n=== Generating {agent_type} draft ===")
-    
-    # Ensure templates are loaded
-    load_templates()
-    
+    draft, _ = generate_draft_with_metadata(agent_type, answers)
+    return draft
+
+def prepare_draft(agent_type, answers):
+    """
+    Assembles the context and the messages.
+    Returns (messages, max_tokens, context_chunks, prompt_tokens).
+    """
     # Format answers
     input_summary = "\n".join([f"Q: {q}\nA: {a}" for q, a in answers.items()])
     print(f"Input summary length: {len(input_summary)} characters")
     
-    # Retrieve relevant context
-    context = retrieve_context(input_summary, agent_type)
+    compiled = compile_prompt(agent_type)
+    if compiled["static_context"]:
+        context, context_chunks = None, compiled["context_chunks"]
+    else:
+        # Retrieve relevant context, packed into the agent's token budget
+        if RETRIEVAL_QUERIES == "per_answer":
+            queries = answer_queries(answers)
+            print(f"Retrieving with {len(queries)} per-answer queries")
+        else:
+            queries = input_summary
+        context, context_chunks = assemble_context(queries, agent_type)
+        if not context:
+            print("WARNING: No context retrieved! Output quality may be poor.")
     
-    if not context:
-        print("WARNING: No context retrieved! Output quality may be poor.")
+    messages, prompt_tokens = build_messages(agent_type, compiled, input_summary, context)
+    print(f"Prompt tokens: {prompt_tokens['static']} static, {prompt_tokens['variable']} variable")
     
-    # Get the appropriate prompt template
-    if agent_type not in PROMPT_TEMPLATES:
-        raise ValueError(f"Unknown agent_type: {agent_type}. Must be 'brand' or 'digital'")
+    # Use different token limits based on agent type
+    max_tokens = MAX_TOKENS[agent_type]
+    return messages, max_tokens, context_chunks, prompt_tokens
+
+# Finished drafts, keyed by everything that shapes the completion
+response_cache = ResponseCache()
+
+def draft_cache_key(agent_type, answers):
+    """Cache key of a draft; call after load_templates so the template version is current."""
+    if GENERATION_MODE == "sections":
+        prompt = [SECTION_PROMPT_TEMPLATES.get(agent_type), SECTION_OUTLINES.get(agent_type)]
+        max_tokens = SECTION_MAX_TOKENS.get(agent_type)
+    else:
+        prompt = PROMPT_TEMPLATES.get(agent_type)
+        max_tokens = MAX_TOKENS.get(agent_type)
+    return response_cache.key(
+        agent_type=agent_type,
+        answers=normalize_answers(answers),
+        templates=[manifest_version(), collection.count()],
+        prompt=prompt,
+        model=COMPLETION_MODEL,
+        temperature=TEMPERATURE,
+        max_tokens=max_tokens,
+        retrieval=[GENERATION_MODE, CONTEXT_SOURCE, RETRIEVAL_MODE, RETRIEVAL_QUERIES, embedder.name],
+        repair=REPAIR_DRAFTS,
+    )
+
+def draft_has_content(draft):
+    """Whether a draft is worth caching: text beyond headings, which stitched sections always have."""
+    return any(line.strip() and not HEADING_RE.match(line.strip()) for line in draft.splitlines())
+
+def draft_metadata(agent_type, context_chunks, prompt_tokens=None, usage=None):
+    """
+    prompt_tokens are the estimated static/variable prompt tokens, usage the reported
+    prompt, cached prompt and completion tokens.
+    """
+    return {
+        "agent_type": agent_type,
+        "model": COMPLETION_MODEL,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "context_chunks": context_chunks,
+        "context_tokens": sum(chunk["tokens"] for chunk in context_chunks),
+        "prompt_tokens": prompt_tokens or {},
+        "usage": usage or {},
+    }
+
+def generate_draft_with_metadata(agent_type, answers, use_cache=True):
+    """
+    Same as generate_draft, also returning the draft metadata: which template chunks
+    went into the prompt and how many tokens they took.
+    With use_cache=False the response cache is not read, only refreshed.
+    """
+    print(f"\n=== Generating {agent_type} draft ===")
     
-    # Final prompt
-    prompt = PROMPT_TEMPLATES[agent_type].format(input=input_summary, context=context)
-    print(f"Final prompt length: {len(prompt)} characters")
+    # Ensure templates are loaded
+    load_templates()
     
-    print("Calling OpenAI API...")
-    # Use different token limits based on agent type
-    max_tokens = 6000 if agent_type == "brand" else 4000
+    cache_key = draft_cache_key(agent_type, answers)
+    cached = response_cache.get(cache_key) if use_cache else None
+    if cached:
+        print("Served from response cache")
+        return cached["draft"], dict(cached["metadata"], cached=True)
+    
+    if GENERATION_MODE == "sections":
+        draft, metadata = generate_sectioned_draft(agent_type, answers)
+        if draft_has_content(draft):
+            response_cache.put(cache_key, {"draft": draft, "metadata": metadata})
+        return draft, metadata
+    messages, max_tokens, context_chunks, prompt_tokens = prepare_draft(agent_type, answers)
     
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "system", "content": prompt}],
-        temperature=0.3,
+    print("Calling OpenAI API...")
+    response = llm.chat(
+        model=COMPLETION_MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
         max_tokens=max_tokens
     )
     
-    generated_text = response.choices[0].message.content
+    generated_text = response.choices[0].message.content or ""
+    usage = usage_tokens(getattr(response, "usage", None))
     print(f"Generated text length: {len(generated_text)} characters")
+    print(f"Prompt tokens cached: {usage['cached_tokens']}/{usage['prompt_tokens']}")
+    
+    metadata = draft_metadata(agent_type, context_chunks, prompt_tokens, usage)
+    generated_text = repair_draft(agent_type, generated_text, answers, metadata,
+                                  truncated=response.choices[0].finish_reason == "length")
     print("=== Generation complete ===\n")
+    if draft_has_content(generated_text):
+        response_cache.put(cache_key, {"draft": generated_text, "metadata": metadata})
+    return generated_text, metadata
+
+def stream_draft(agent_type, answers, metadata=None, use_cache=True):
+    """
+    Streaming variant of generate_draft: yields the draft text in pieces as the model
+    produces them. If a metadata dict is passed it is filled with the draft metadata
+    once the stream has finished. A cached draft is yielded in one piece; only
+    streams that ran to the end are cached.
+    When the final draft differs from the yielded pieces (sections repaired after the
+    stream, see repair_draft, or stitched in sections mode) it is passed as
+    metadata["draft"].
+    """
+    print(f"\n=== Streaming {agent_type} draft ===")
+    load_templates()
+    cache_key = draft_cache_key(agent_type, answers)
+    cached = response_cache.get(cache_key) if use_cache else None
+    if cached:
+        print("Served from response cache")
+        yield cached["draft"]
+        if metadata is not None:
+            metadata.update(cached["metadata"], cached=True)
+        return
     
-    return generated_text
+    pieces = []
+    prompt_tokens, usage = {}, {}
+    finish_reason = None
+    cut_off = []  # sections mode: sections that stopped at SECTION_MAX_TOKENS
+    started = time.monotonic()
+    first_token_seconds = None
+    if GENERATION_MODE == "sections":
+        # Sections are yielded whole, in outline order, as they complete
+        context_chunks, texts = [], []
+        for section, text, section_chunks, section_tokens, section_usage, section_finish in iter_sections(
+                agent_type, answers):
+            texts.append(text)
+            if section_finish == "length":
+                cut_off.append(section["title"])
+            context_chunks.extend(section_chunks)
+            add_counts(prompt_tokens, section_tokens)
+            add_counts(usage, section_usage)
+            if first_token_seconds is None:
+                first_token_seconds = time.monotonic() - started
+            pieces.append(normalize_section(section["title"], text) + "\n\n")
+            yield pieces[-1]
+        # The draft itself is stitched like generate_sectioned_draft's
+        streamed = stitch_sections(SECTION_OUTLINES[agent_type], texts)
+    else:
+        messages, max_tokens, context_chunks, prompt_tokens = prepare_draft(agent_type, answers)
+        
+        print("Calling OpenAI API (streaming)...")
+        started = time.monotonic()
+        stream = llm.stream_chat(
+            model=COMPLETION_MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=max_tokens,
+            stream_options={"include_usage": True}
+        )
+        
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = usage_tokens(chunk.usage)
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token_seconds is None:
+                    first_token_seconds = time.monotonic() - started
+                pieces.append(delta)
+                yield delta
+        streamed = "".join(pieces)
+    print(f"Generated text length: {len(streamed)} characters")
+    if usage:
+        print(f"Prompt tokens cached: {usage['cached_tokens']}/{usage['prompt_tokens']}")
+    
+    draft_meta = draft_metadata(agent_type, context_chunks, prompt_tokens, usage)
+    if first_token_seconds is not None:
+        draft_meta["first_token_seconds"] = round(first_token_seconds, 3)
+    draft = repair_draft(agent_type, streamed, answers, draft_meta, truncated=finish_reason == "length",
+                         cut_off=cut_off)
+    print("=== Generation complete ===\n")
+    if draft_has_content(draft):
+        response_cache.put(cache_key, {"draft": draft, "metadata": draft_meta})
+    if metadata is not None:
+        metadata.update(draft_meta)
+        if draft != "".join(pieces):
+            metadata["draft"] = draft
+
+def rewrite_sections(agent_type, draft, answers, sections, metadata):
+    """
+    Generates the given outline sections and splices them into draft by heading.
+    Their context chunks and token counts are added to metadata. Returns the new draft.
+    """
+    if not sections:
+        return draft
+    replacements = {}
+    for section, text, section_chunks, section_tokens, section_usage, _ in iter_sections(agent_type, answers, sections):
+        replacements[section["title"]] = normalize_section(section["title"], text)
+        metadata["context_chunks"].extend(section_chunks)
+        add_counts(metadata["prompt_tokens"], section_tokens)
+        add_counts(metadata["usage"], section_usage)
+    metadata["context_tokens"] = sum(chunk["tokens"] for chunk in metadata["context_chunks"])
+    return splice_sections(SECTION_OUTLINES[agent_type], draft, replacements)
+
+def repair_draft(agent_type, draft, answers, metadata, truncated=False, cut_off=()):
+    """
+    Checks draft against the agent's outline and rewrites only the sections that are
+    missing, empty or cut off: the one the draft ends in when the completion hit
+    max_tokens (truncated=True), and the titles in cut_off, sections written on their
+    own that hit SECTION_MAX_TOKENS.
+    Their titles are recorded in metadata["repaired_sections"]. Returns the draft.
+    """
+    titles = []
+    if REPAIR_DRAFTS:
+        titles = check_draft(SECTION_OUTLINES[agent_type], draft, truncated)
+        titles = [section["title"] for section in SECTION_OUTLINES[agent_type]
+                  if section["title"] in titles or section["title"] in cut_off]
+    metadata["repaired_sections"] = titles
+    if not titles:
+        return draft
+    print(f"Repairing {len(titles)} sections{' after truncation' if truncated or cut_off else ''}: "
+          f"{', '.join(titles)}")
+    sections = [section for section in SECTION_OUTLINES[agent_type] if section["title"] in titles]
+    return rewrite_sections(agent_type, draft, answers, sections, metadata)
+
+def update_draft(agent_type, draft, old_answers, new_answers):
+    """
+    Regenerates only the sections written from answers that changed between old_answers
+    and new_answers, and splices them into draft by heading. Every other section is kept
+    as it is, manual edits included. Returns (draft, metadata); metadata["updated_sections"]
+    lists the rewritten section titles.
+    """
+    print(f"\n=== Updating {agent_type} draft ===")
+    load_templates()
+    sections = impacted_sections(agent_type, old_answers, new_answers)
+    metadata = draft_metadata(agent_type, [])
+    draft = rewrite_sections(agent_type, draft, new_answers, sections, metadata)
+    print(f"Updated {len(sections)} sections: {', '.join(s['title'] for s in sections) or 'none'}")
+    print("=== Update complete ===\n")
+    metadata["updated_sections"] = [section["title"] for section in sections]
+    return draft, metadata
 
 # Export to Word
 def export_to_word(markdown_text, client_name):
-    doc = Document()
+    doc = new_document()  # a copy of the cached branded base (styles, header/footer, fonts)
     doc.add_heading(f"{client_name} - Strategy Document", 0)
     doc.add_paragraph(f"Generated on: {datetime.now().strftime('%B %d, %Y')}")
     doc.add_paragraph()
 
-    for line in markdown_text.split("\n"):
-        line = line.strip()
-        if line.startswith("# "):
-            doc.add_heading(line[2:], level=1)
-        elif line.startswith("## "):
-            doc.add_heading(line[3:], level=2)
-        elif line.startswith("### "):
-            doc.add_heading(line[4:], level=3)
-        elif line.startswith("- ") or line.startswith("· "):
-            p = doc.add_paragraph(style='List Bullet')
-            p.add_run(line[2:])
-        elif line.startswith("1. "):
-            p = doc.add_paragraph(style='List Number')
-            p.add_run(line[3:])
-        elif line:
-            doc.add_paragraph(line)
+    render_markdown(doc, markdown_text)
 
     buffer = io.BytesIO()
     doc.save(buffer)
@@ -340,8 +808,15 @@ def export_to_word(markdown_text, client_name):
 # Utility function to reset/debug ChromaDB
 def reset_chroma():
     """Call this if you need to force reload templates"""
-    global collection
+    global collection, synced_templates_state, routing_synced_state
     client.delete_collection(name="marketing_templates")
     collection = client.get_or_create_collection(name="marketing_templates")
+    check_index_model(collection, embedder)
+    reset_manifest()
+    # The library's resume log would otherwise skip files whose chunks were just deleted
+    if os.path.exists(LIBRARY_PROGRESS_PATH):
+        os.remove(LIBRARY_PROGRESS_PATH)
+    synced_templates_state = None
+    routing_synced_state = None
     load_templates()
     print("ChromaDB reset and templates reloaded")
\ No newline at end of file
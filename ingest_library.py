@@ -0,0 +1,151 @@
+# ingest_library.py
+"""
+Bulk-indexes a directory of past client deliverables (.docx / .md) into the
+"marketing_templates" collection.
+
+    python ingest_library.py ./library --type digital_example
+
+Files are extracted and chunked in a process pool, chunks are embedded in fixed-size
+batches and written with bulk upsert calls. Finished files are appended to a progress
+file, so an interrupted run picks up where it stopped when started again.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from ingestion import LIBRARY_PROGRESS_PATH, TEMPLATE_FILES, iter_library_files, library_chunks
+from storage import read_jsonl
+
+EMBED_BATCH_SIZE = 256
+# Chroma filters with $in lists, keep them to a reasonable size
+FILTER_SLICE = 500
+
+
+def load_progress(path):
+    return {record["path"]: record for record in read_jsonl(path)}
+
+
+def is_done(filepath, record, indexed):
+    """Whether the file is unchanged since its progress record and its chunks are still indexed."""
+    if not record:
+        return False
+    stat = os.stat(filepath)
+    if record["mtime"] != stat.st_mtime or record["size"] != stat.st_size:
+        return False
+    return record["chunks"] == 0 or filepath in indexed
+
+
+def indexed_sources(collection, paths):
+    """The paths that have chunks in the collection (it may have been reset since they were logged)."""
+    found = set()
+    for start in range(0, len(paths), FILTER_SLICE):
+        result = collection.get(where={"source": {"$in": paths[start:start + FILTER_SLICE]}}, include=["metadatas"])
+        found.update(metadata["source"] for metadata in result["metadatas"])
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index a template library directory into ChromaDB")
+    parser.add_argument("directory", help="Directory to walk for .docx and .md files")
+    parser.add_argument("--type", default="digital_example", choices=sorted(TEMPLATE_FILES),
+                        help="Template type used by retrieval filters (default: digital_example)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Extraction processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help=f"Chunks per embedding call and per collection.upsert (default: {EMBED_BATCH_SIZE})")
+    parser.add_argument("--progress-file", default=LIBRARY_PROGRESS_PATH,
+                        help=f"Resume log of indexed files (default: {LIBRARY_PROGRESS_PATH})")
+    parser.add_argument("--restart", action="store_true", help="Ignore the progress file and index everything")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.progress_file):
+        os.remove(args.progress_file)
+    progress = load_progress(args.progress_file)
+
+    # Imported here so extraction workers don't load the embedding model
+    from generator2 import collection, embed_documents, sync_indexes
+
+    files = list(iter_library_files(args.directory))
+    indexed = indexed_sources(collection, [path for path in files if progress.get(path)])
+    pending = [path for path in files if not is_done(path, progress.get(path), indexed)]
+    print(f"Found {len(files)} files, {len(files) - len(pending)} already indexed, {len(pending)} to go")
+    if not pending:
+        return
+
+    # Drop whatever an interrupted run left behind for files that are not marked done
+    for start in range(0, len(pending), FILTER_SLICE):
+        collection.delete(where={"source": {"$in": pending[start:start + FILTER_SLICE]}})
+
+    buffer = []     # chunks waiting for an embedding batch
+    remaining = {}  # filepath -> chunks not written yet
+    finished = {}   # filepath -> progress record, written once all its chunks are added
+    stats = {"files": 0, "chunks": 0}
+    started = time.perf_counter()
+
+    def mark_done(progress_file, filepath):
+        progress_file.write(json.dumps(finished.pop(filepath)) + "\n")
+        progress_file.flush()
+        stats["files"] += 1
+
+    def write_batches(progress_file, final=False):
+        while len(buffer) >= args.batch_size or (final and buffer):
+            batch = buffer[:args.batch_size]
+            del buffer[:args.batch_size]
+            texts = [chunk["text"] for chunk in batch]
+            # upsert, so entries indexed under an older spelling of the path are replaced too
+            collection.upsert(
+                documents=texts,
+                metadatas=[chunk["metadata"] for chunk in batch],
+                ids=[chunk["id"] for chunk in batch],
+                embeddings=embed_documents(texts)
+            )
+            stats["chunks"] += len(batch)
+            for chunk in batch:
+                source = chunk["metadata"]["source"]
+                remaining[source] -= 1
+                if remaining[source] == 0:
+                    del remaining[source]
+                    mark_done(progress_file, source)
+            elapsed = time.perf_counter() - started
+            print(f"[{stats['files']}/{len(pending)} files] {stats['chunks']} chunks indexed "
+                  f"({stats['chunks'] / elapsed:.0f} chunks/s)")
+
+    context = multiprocessing.get_context("spawn")
+    with open(args.progress_file, "a", encoding="utf-8") as progress_file, \
+            ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as executor:
+        try:
+            results = executor.map(library_chunks, pending, repeat(args.type), chunksize=4)
+            for filepath, sha256, chunks in results:
+                stat = os.stat(filepath)
+                finished[filepath] = {
+                    "path": filepath,
+                    "sha256": sha256,
+                    "mtime": stat.st_mtime,
+                    "size": stat.st_size,
+                    "chunks": len(chunks),
+                }
+                if not chunks:
+                    print(f"WARNING: {filepath} produced no chunks")
+                    mark_done(progress_file, filepath)
+                    continue
+                remaining[filepath] = len(chunks)
+                buffer.extend(chunks)
+                write_batches(progress_file)
+            write_batches(progress_file, final=True)
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            print(f"Interrupted after {stats['files']} files. Run again to resume.")
+            raise SystemExit(130)
+
+    sync_indexes(force=True)
+    elapsed = time.perf_counter() - started
+    print(f"Indexed {stats['files']} files / {stats['chunks']} chunks in {elapsed:.1f}s. "
+          f"Collection count: {collection.count()}")
+
+
+if __name__ == "__main__":
+    main()
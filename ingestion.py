@@ -0,0 +1,464 @@
+# ingestion.py
+import hashlib
+import json
+import os
+import zipfile
+from xml.etree import ElementTree
+
+# Template files indexed into the "marketing_templates" collection (generator2 type names)
+TEMPLATE_FILES = {
+    "brand_template": "Brand Guideline.docx",
+    "digital_template": "Digital Strategy.docx",
+    "digital_example": "Digital Strategy Example.docx",
+}
+
+# Headings deeper than this are used as body text in the templates (e.g. "Heading 5")
+MAX_SECTION_LEVEL = 4
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces, keep chunks comfortably below that
+MAX_CHUNK_WORDS = 180
+
+EMBED_BATCH_SIZE = 32
+
+# sha256/mtime of every indexed source file and chunk, kept next to ./chroma_db
+MANIFEST_PATH = "./chroma_manifest.json"
+# Files ingest_library.py has finished indexing, so interrupted runs can resume
+LIBRARY_PROGRESS_PATH = "./chroma_library_progress.jsonl"
+
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P = W_NS + "p"
+W_T = W_NS + "t"
+W_TAB = W_NS + "tab"
+W_BR = W_NS + "br"
+W_TC = W_NS + "tc"
+W_TR = W_NS + "tr"
+W_TBL = W_NS + "tbl"
+W_BODY = W_NS + "body"
+W_PPR = W_NS + "pPr"
+W_PSTYLE = W_NS + "pStyle"
+W_OUTLINE_LVL = W_NS + "outlineLvl"
+W_VAL = W_NS + "val"
+
+
+def heading_level(style_name):
+    """
+    Returns the outline level for a Word paragraph style, or None for body text.
+    "Title" is used as a top-level section heading in the digital templates.
+    """
+    if not style_name:
+        return None
+    style_name = style_name.lower()
+    if style_name == "title":
+        return 0
+    if style_name.startswith("heading "):
+        try:
+            level = int(style_name.split(" ", 1)[1])
+        except ValueError:
+            return None
+        return level if level <= MAX_SECTION_LEVEL else None
+    return None
+
+
+def _read_style_levels(archive):
+    """Maps styleId -> heading level from word/styles.xml (a few KB, parsed whole)."""
+    try:
+        root = ElementTree.fromstring(archive.read("word/styles.xml"))
+    except KeyError:
+        return {}
+    levels = {}
+    for style in root.iter(W_NS + "style"):
+        name = style.find(W_NS + "name")
+        level = heading_level(name.get(W_VAL) if name is not None else None)
+        if level is None:
+            outline = style.find(f"{W_PPR}/{W_OUTLINE_LVL}")
+            if outline is not None and int(outline.get(W_VAL)) + 1 <= MAX_SECTION_LEVEL:
+                level = int(outline.get(W_VAL)) + 1
+        if level is not None:
+            levels[style.get(W_NS + "styleId")] = level
+    return levels
+
+
+def _paragraph_level(paragraph, style_levels):
+    ppr = paragraph.find(W_PPR)
+    if ppr is None:
+        return None
+    style = ppr.find(W_PSTYLE)
+    if style is not None and style.get(W_VAL) in style_levels:
+        return style_levels[style.get(W_VAL)]
+    outline = ppr.find(W_OUTLINE_LVL)
+    if outline is not None and int(outline.get(W_VAL)) + 1 <= MAX_SECTION_LEVEL:
+        return int(outline.get(W_VAL)) + 1
+    return None
+
+
+def _paragraph_text(paragraph):
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == W_T:
+            parts.append(node.text or "")
+        elif node.tag in (W_TAB, W_BR):
+            parts.append(" ")
+    return "".join(parts).strip()
+
+
+def _row_blocks(cells):
+    # Layout tables (the brand template keeps every section in one) hold headings:
+    # keep their paragraphs as separate blocks. Data tables collapse to one row line.
+    if any(kind == "heading" for cell in cells for kind, _, _ in cell):
+        return [block for cell in cells for block in cell]
+    texts = [" ".join(text for _, _, text in cell) for cell in cells]
+    if not any(texts):
+        return []
+    return [("row", None, " | ".join(texts))]
+
+
+def iter_docx_blocks(filepath):
+    """
+    Stream-parses word/document.xml and yields (kind, heading_level, text) in document
+    order, where kind is "heading", "paragraph" or "row". Only styles.xml and
+    document.xml are read from the archive, so embedded media is never decompressed.
+    """
+    with zipfile.ZipFile(filepath) as archive:
+        style_levels = _read_style_levels(archive)
+        with archive.open("word/document.xml") as xml:
+            body = None
+            cells = []  # paragraph blocks of the open table cells, innermost last
+            rows = []   # cells of the open table rows, innermost last
+            for event, elem in ElementTree.iterparse(xml, events=("start", "end")):
+                if event == "start":
+                    if elem.tag == W_TR:
+                        rows.append([])
+                    elif elem.tag == W_TC:
+                        cells.append([])
+                    elif elem.tag == W_BODY:
+                        body = elem
+                    continue
+
+                if elem.tag == W_P:
+                    text = _paragraph_text(elem)
+                    level = _paragraph_level(elem, style_levels)
+                    # Clearing also keeps text boxes from repeating in the enclosing paragraph
+                    elem.clear()
+                    if not text:
+                        blocks = []
+                    elif level is None:
+                        blocks = [("paragraph", None, text)]
+                    else:
+                        blocks = [("heading", level, text)]
+                elif elem.tag == W_TC:
+                    rows[-1].append(cells.pop())
+                    continue
+                elif elem.tag == W_TR:
+                    blocks = _row_blocks(rows.pop())
+                elif elem.tag == W_TBL:
+                    elem.clear()
+                    blocks = []
+                else:
+                    continue
+
+                if cells:
+                    cells[-1].extend(blocks)
+                else:
+                    yield from blocks
+                    if body is not None and not rows:
+                        # Finished a top-level block, drop the parsed elements
+                        body.clear()
+
+
+def extract_text_from_docx(filepath):
+    try:
+        return "\n".join(text for _, _, text in iter_docx_blocks(filepath))
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+        return ""
+
+
+def _split_words(paragraphs, max_words):
+    parts, current, count = [], [], 0
+    for para in paragraphs:
+        words = para.split()
+        # A single oversized paragraph is split on word boundaries
+        while len(words) > max_words:
+            if current:
+                parts.append(current)
+                current, count = [], 0
+            parts.append([" ".join(words[:max_words])])
+            words = words[max_words:]
+        if count + len(words) > max_words and current:
+            parts.append(current)
+            current, count = [], 0
+        current.append(" ".join(words))
+        count += len(words)
+    if current:
+        parts.append(current)
+    return parts
+
+
+def iter_markdown_blocks(filepath):
+    """Yields (kind, heading_level, text) for a Markdown file, like iter_docx_blocks."""
+    with open(filepath, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                marks = len(line) - len(line.lstrip("#"))
+                title = line[marks:].strip()
+                if title and marks <= 6:
+                    level = marks if marks <= MAX_SECTION_LEVEL else None
+                    yield ("heading", level, title) if level else ("paragraph", None, title)
+                    continue
+            if line.startswith("|"):
+                cells = [cell.strip() for cell in line.strip("|").split("|")]
+                # Skip the |---|---| separator row
+                if all(cell and set(cell) <= set("-: ") for cell in cells):
+                    continue
+                yield "row", None, " | ".join(cells)
+                continue
+            yield "paragraph", None, line
+
+
+def chunk_blocks(blocks, template_type, source, max_words=MAX_CHUNK_WORDS, id_prefix=None):
+    """
+    Groups (kind, heading_level, text) blocks into one chunk per heading section.
+    Each chunk starts with its heading path so the embedding sees where it sits in
+    the template. Headings without body text are kept only when they are leaves.
+    Ids come from the heading path and the part within the section, not the
+    position in the document, so editing one section leaves the others' ids and
+    hashes alone. The position is kept as the "order" metadata, outside the hash.
+    """
+    id_prefix = id_prefix or template_type
+    chunks = []
+    path = []  # [(level, title)]
+    body = []
+    seen_paths = {}  # heading path -> sections with that path so far
+
+    def flush(is_leaf):
+        if not body and not (path and is_leaf):
+            return
+        heading_path = " > ".join(title for _, title in path)
+        # Repeated heading paths are told apart by occurrence
+        occurrence = seen_paths.get(heading_path, 0)
+        seen_paths[heading_path] = occurrence + 1
+        for part, paragraphs in enumerate(_split_words(body, max_words) or [[]]):
+            text = "\n".join([heading_path] + paragraphs) if heading_path else "\n".join(paragraphs)
+            key = hashlib.sha1(f"{heading_path}\x1f{occurrence}\x1f{part}".encode("utf-8")).hexdigest()[:16]
+            chunks.append({
+                "id": f"{id_prefix}:{key}",
+                "text": text,
+                "metadata": {
+                    "type": template_type,
+                    "source": source,
+                    "heading_path": heading_path,
+                    "heading_level": path[-1][0] if path else -1,
+                    "part": part,
+                    "order": len(chunks),
+                },
+            })
+
+    for kind, level, text in blocks:
+        if kind != "heading":
+            body.append(text)
+            continue
+        # A new heading at the same or a higher level closes the current section as a leaf
+        flush(is_leaf=not path or level <= path[-1][0])
+        body = []
+        while path and path[-1][0] >= level:
+            path.pop()
+        path.append((level, text))
+
+    flush(is_leaf=True)
+    return chunks
+
+
+def chunk_docx(filepath, template_type, id_prefix=None):
+    try:
+        blocks = list(iter_docx_blocks(filepath))
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+        return []
+    return chunk_blocks(blocks, template_type, source=filepath, id_prefix=id_prefix)
+
+
+def chunk_markdown(filepath, template_type, id_prefix=None):
+    try:
+        blocks = list(iter_markdown_blocks(filepath))
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+        return []
+    return chunk_blocks(blocks, template_type, source=filepath, id_prefix=id_prefix)
+
+
+# Template library (past client deliverables)
+LIBRARY_ID_PREFIX = "library:"
+LIBRARY_EXTENSIONS = {".docx": chunk_docx, ".md": chunk_markdown}
+
+
+def iter_library_files(root):
+    """
+    Yields the library's documents as absolute paths, which are used as the progress
+    key, the chunks' source and their ids, so any spelling of root finds the same entries.
+    """
+    for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            # Skip Word lock files (~$name.docx)
+            if filename.startswith("~$"):
+                continue
+            if os.path.splitext(filename)[1].lower() in LIBRARY_EXTENSIONS:
+                yield os.path.join(dirpath, filename)
+
+
+def library_chunks(filepath, template_type):
+    """
+    Chunks one library document. Runs in ingestion worker processes, so it returns
+    plain data: (filepath, sha256, chunks).
+    """
+    sha256 = file_sha256(filepath)
+    # Ids are stable per path so a re-run replaces the same entries; filepath is
+    # absolute (see iter_library_files)
+    path_hash = hashlib.sha1(filepath.encode("utf-8")).hexdigest()[:16]
+    chunker = LIBRARY_EXTENSIONS[os.path.splitext(filepath)[1].lower()]
+    chunks = chunker(filepath, template_type, id_prefix=f"{LIBRARY_ID_PREFIX}{path_hash}")
+    for chunk in chunks:
+        chunk["metadata"]["library"] = True
+    return filepath, sha256, chunks
+
+
+def embed_in_batches(texts, embedding_function, batch_size=EMBED_BATCH_SIZE):
+    embeddings = []
+    for start in range(0, len(texts), batch_size):
+        embeddings.extend(embedding_function(texts[start:start + batch_size]))
+    return embeddings
+
+
+# Incremental re-indexing
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(chunk):
+    # Without "order", so chunks that only moved are not embedded again
+    metadata = {key: value for key, value in chunk["metadata"].items() if key != "order"}
+    payload = json.dumps([chunk["text"], metadata], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def manifest_version(path=MANIFEST_PATH):
+    """Hash of every indexed template chunk; changes whenever any template chunk does."""
+    files = load_manifest(path).get("files", {})
+    payload = json.dumps({template_type: entry["chunks"] for template_type, entry in files.items()}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def reset_manifest(path=MANIFEST_PATH):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def sync_templates(collection, embed_documents, templates=TEMPLATE_FILES, manifest_path=MANIFEST_PATH):
+    """
+    Brings the collection in line with the template files using the manifest.
+    Unchanged files are detected by mtime/size (then sha256) without being parsed;
+    changed files are re-chunked and only chunks whose hash differs are embedded
+    and upserted; chunks that only moved get their "order" updated without being
+    embedded. Chunks that no longer exist are deleted.
+    Returns {"upserted": n, "moved": n, "deleted": n}.
+    """
+    manifest = load_manifest(manifest_path)
+    files = manifest.setdefault("files", {})
+
+    # Entries of template types we manage, plus pre-chunking whole-document ids
+    indexed_ids = {
+        chunk_id for chunk_id in collection.get(where={"type": {"$in": list(templates)}}, include=[])["ids"]
+        if not chunk_id.startswith(LIBRARY_ID_PREFIX)
+    }
+    indexed_ids.update(collection.get(ids=list(templates), include=[])["ids"])
+    manifest_ids = {chunk_id for entry in files.values() for chunk_id in entry["chunks"]}
+    stale_ids = set()
+    if indexed_ids != manifest_ids:
+        # The collection was reset or edited outside the manifest: rebuild every file
+        if files:
+            print("Template manifest does not match the collection, re-indexing all templates")
+        files.clear()
+        stale_ids.update(indexed_ids)
+
+    upserts, moves = [], []
+    for template_type in list(files):
+        if template_type not in templates:
+            stale_ids.update(files.pop(template_type)["chunks"])
+
+    for template_type, filepath in templates.items():
+        entry = files.get(template_type)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            print(f"WARNING: {filepath} not found, keeping its indexed chunks")
+            stale_ids = {chunk_id for chunk_id in stale_ids if not chunk_id.startswith(f"{template_type}:")}
+            continue
+        if entry and entry["path"] == filepath and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            continue
+
+        sha256 = file_sha256(filepath)
+        if entry and entry["path"] == filepath and entry["sha256"] == sha256:
+            entry.update(mtime=stat.st_mtime, size=stat.st_size)
+            continue
+
+        chunks = chunk_docx(filepath, template_type)
+        if not chunks:
+            print(f"WARNING: {filepath} produced no chunks!")
+            continue
+        old_chunks = entry["chunks"] if entry else {}
+        old_orders = entry.get("orders", {}) if entry else {}
+        new_chunks = {chunk["id"]: chunk_sha256(chunk) for chunk in chunks}
+        for chunk in chunks:
+            if old_chunks.get(chunk["id"]) != new_chunks[chunk["id"]]:
+                upserts.append(chunk)
+            elif old_orders.get(chunk["id"]) != chunk["metadata"]["order"]:
+                moves.append(chunk)
+        stale_ids.update(set(old_chunks) - set(new_chunks))
+        files[template_type] = {
+            "path": filepath,
+            "sha256": sha256,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "chunks": new_chunks,
+            "orders": {chunk["id"]: chunk["metadata"]["order"] for chunk in chunks},
+        }
+        print(f"{filepath}: {len(chunks)} chunks, {sum(1 for c in upserts if c['metadata']['type'] == template_type)} changed")
+
+    stale_ids -= {chunk["id"] for chunk in upserts}
+    if stale_ids:
+        collection.delete(ids=sorted(stale_ids))
+    if upserts:
+        texts = [chunk["text"] for chunk in upserts]
+        collection.upsert(
+            documents=texts,
+            metadatas=[chunk["metadata"] for chunk in upserts],
+            ids=[chunk["id"] for chunk in upserts],
+            embeddings=embed_in_batches(texts, embed_documents)
+        )
+    if moves:
+        collection.update(ids=[chunk["id"] for chunk in moves], metadatas=[chunk["metadata"] for chunk in moves])
+    save_manifest(manifest, manifest_path)
+    return {"upserted": len(upserts), "moved": len(moves), "deleted": len(stale_ids)}
@@ -0,0 +1,202 @@
+# job_queue.py
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from storage import sqlite_connection
+
+JOBS_PATH = "./jobs.sqlite3"
+
+# Seconds between writes of the partial draft while a job streams
+PARTIAL_INTERVAL = 0.5
+
+# Idle workers look for new jobs this often (jobs may come from other processes)
+POLL_INTERVAL = 1.0
+
+# Running jobs are marked alive this often; a job whose mark is older than
+# STALE_AFTER belongs to a process that died and is queued again
+HEARTBEAT_INTERVAL = 5.0
+STALE_AFTER = 30.0
+
+
+class JobQueue:
+    """
+    Draft generation jobs in a SQLite table, run by a pool of worker threads.
+
+    runner(agent_type, answers, metadata, use_cache) is a generator of text pieces
+    with the signature of generator2.stream_draft; its output is saved as the job's
+    partial draft while it runs, then as the final draft (metadata["draft"] if the
+    runner set it) and metadata.
+
+    Update jobs (submit_update) rewrite an existing draft for changed answers with
+    updater(agent_type, draft, old_answers, new_answers), which has the signature of
+    generator2.update_draft; the result keeps the old draft's metadata with the
+    update's usage and updated_sections. Jobs outlive
+    the Streamlit session that submitted them. Each queue stamps the jobs it runs
+    with its own token and a heartbeat, so jobs left running by a process that died
+    are queued again once their heartbeat goes stale.
+    """
+
+    def __init__(self, runner, updater=None, path=JOBS_PATH, workers=2):
+        self.runner = runner
+        self.updater = updater
+        self.path = path
+        self.token = uuid.uuid4().hex
+        self._wake = threading.Event()
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL DEFAULT 'draft',
+                agent_type TEXT NOT NULL,
+                answers TEXT NOT NULL,
+                use_cache INTEGER NOT NULL,
+                source TEXT,
+                status TEXT NOT NULL,
+                partial TEXT NOT NULL DEFAULT '',
+                draft TEXT,
+                metadata TEXT,
+                error TEXT,
+                worker_token TEXT,
+                heartbeat_at REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL)""")
+            # Add the columns missing from tables made by earlier versions
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("kind", "TEXT NOT NULL DEFAULT 'draft'"), ("source", "TEXT"),
+                                 ("worker_token", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def _connect(self):
+        return sqlite_connection(self.path, row_factory=sqlite3.Row)
+
+    def submit(self, agent_type, answers, use_cache=True):
+        job_id = uuid.uuid4().hex[:12]
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs (id, agent_type, answers, use_cache, status, created_at) "
+                       "VALUES (?, ?, ?, ?, 'queued', ?)",
+                       (job_id, agent_type, json.dumps(answers), int(use_cache), time.time()))
+        self._wake.set()
+        return job_id
+
+    def submit_update(self, agent_type, answers, draft, draft_answers, draft_metadata=None):
+        """Queues a rewrite of draft, written from draft_answers, for the new answers."""
+        job_id = uuid.uuid4().hex[:12]
+        source = {"draft": draft, "answers": draft_answers, "metadata": draft_metadata}
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs (id, kind, agent_type, answers, use_cache, source, status, created_at) "
+                       "VALUES (?, 'update', ?, ?, 0, ?, 'queued', ?)",
+                       (job_id, agent_type, json.dumps(answers), json.dumps(source), time.time()))
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def get_many(self, job_ids):
+        if not job_ids:
+            return []
+        with self._connect() as db:
+            rows = db.execute(f"SELECT * FROM jobs WHERE id IN ({','.join('?' * len(job_ids))})",
+                              list(job_ids)).fetchall()
+        jobs = {row["id"]: self._to_dict(row) for row in rows}
+        return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+    def queue_depth(self):
+        with self._connect() as db:
+            return dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["answers"] = json.loads(job["answers"])
+        job["metadata"] = json.loads(job["metadata"]) if job["metadata"] else None
+        job["source"] = json.loads(job["source"]) if job["source"] else None
+        return job
+
+    # Workers
+    def _claim(self):
+        """Marks the oldest queued job as running by this queue and returns it."""
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            orphans = db.execute(
+                "UPDATE jobs SET status = 'queued', partial = '', worker_token = NULL, heartbeat_at = NULL "
+                "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (time.time() - STALE_AFTER,)).rowcount
+            if orphans:
+                print(f"Re-queued {orphans} interrupted jobs")
+            row = db.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            db.execute("UPDATE jobs SET status = 'running', worker_token = ?, heartbeat_at = ?, started_at = ? "
+                       "WHERE id = ?", (self.token, now, now, row["id"]))
+        return self._to_dict(row)
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as db:
+            db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", list(fields.values()) + [job_id])
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                with self._connect() as db:
+                    db.execute("UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND worker_token = ?",
+                               (time.time(), self.token))
+            except sqlite3.Error as e:
+                print(f"Job queue error: {e}")
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Job queue error: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        print(f"Job {job['id']}: {'updating' if job['kind'] == 'update' else 'generating'} "
+              f"{job['agent_type']} draft")
+        pieces, metadata = [], {}
+        last_write = time.monotonic()
+        try:
+            if job["kind"] == "update":
+                source = job["source"]
+                draft, update_metadata = self.updater(job["agent_type"], source["draft"], source["answers"],
+                                                      job["answers"])
+                metadata = dict(source["metadata"] or {}, cached=False, first_token_seconds=None,
+                                updated_sections=update_metadata["updated_sections"],
+                                usage=update_metadata["usage"])
+                metadata.pop("repaired_sections", None)  # those were reported with the old draft
+            else:
+                for piece in self.runner(job["agent_type"], job["answers"], metadata,
+                                         use_cache=bool(job["use_cache"])):
+                    pieces.append(piece)
+                    if time.monotonic() - last_write >= PARTIAL_INTERVAL:
+                        self._update(job["id"], partial="".join(pieces))
+                        last_write = time.monotonic()
+                # The runner may have repaired the streamed draft afterwards
+                draft = metadata.pop("draft", None) or "".join(pieces)
+            self._update(job["id"], status="done", partial=draft, draft=draft,
+                         metadata=json.dumps(metadata), finished_at=time.time())
+            print(f"Job {job['id']}: done ({len(draft)} characters)")
+        except Exception as e:
+            self._update(job["id"], status="failed", partial="".join(pieces),
+                         error=f"{e.__class__.__name__}: {e}", finished_at=time.time())
+            print(f"Job {job['id']}: failed: {e}")
@@ -0,0 +1,146 @@
+# lexical_index.py
+import json
+import os
+import re
+
+import numpy as np
+
+from vector_index import MetadataMasks, current_version, new_version, publish_version
+
+INDEX_DIR = "./lexical_index"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Reciprocal rank fusion constant (Cormack et al.)
+RRF_K = 60
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[&'][a-z0-9]+)*")
+
+
+def tokenize(text):
+    # Keeps acronyms (MACTE), brand and channel names as single lowercase terms
+    return TOKEN_RE.findall(text.lower().replace("’", "'"))
+
+
+class BM25Index:
+    """
+    BM25 over the template chunks, stored as a CSR inverted index.
+
+    Postings for term t are doc_ids[indptr[t]:indptr[t + 1]] with their precomputed
+    BM25 weights, so scoring a query is a slice per query term plus one bincount.
+    The index is rebuilt from the collection whenever the collection changes; like
+    NumpyVectorIndex, each build gets its own version directory and is published by
+    rewriting CURRENT, so postings and rows always come from the same build.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.vocabulary = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.filters = MetadataMasks([])
+        self._loaded_version = None
+        self.refresh()
+
+    def count(self):
+        return len(self.ids)
+
+    def refresh(self):
+        """(Re)loads the index if another process or call published a new build."""
+        version = current_version(self.index_dir)
+        if version is None or version == self._loaded_version:
+            return
+        version_dir = os.path.join(self.index_dir, version)
+        with open(os.path.join(version_dir, "rows.json"), encoding="utf-8") as f:
+            rows = json.load(f)
+        with np.load(os.path.join(version_dir, "postings.npz")) as arrays:
+            self.indptr, self.doc_ids, self.weights = arrays["indptr"], arrays["doc_ids"], arrays["weights"]
+        self.ids, self.documents = rows["ids"], rows["documents"]
+        self.vocabulary = {term: i for i, term in enumerate(rows["terms"])}
+        self.filters = MetadataMasks(rows["metadatas"])
+        self.metadatas = self.filters.metadatas
+        self._loaded_version = version
+
+    def build(self, ids, documents, metadatas):
+        vocabulary, postings = {}, []  # postings: [(term id, doc row, term frequency)]
+        doc_lengths = np.zeros(len(ids), dtype=np.float32)
+        for row, document in enumerate(documents):
+            tokens = tokenize(document or "")
+            doc_lengths[row] = len(tokens)
+            counts = {}
+            for token in tokens:
+                term = vocabulary.setdefault(token, len(vocabulary))
+                counts[term] = counts.get(term, 0) + 1
+            postings.extend((term, row, tf) for term, tf in counts.items())
+
+        terms = np.array([p[0] for p in postings], dtype=np.int64)
+        doc_ids = np.array([p[1] for p in postings], dtype=np.int32)
+        tf = np.array([p[2] for p in postings], dtype=np.float32)
+        order = np.argsort(terms, kind="stable")
+        terms, doc_ids, tf = terms[order], doc_ids[order], tf[order]
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=indptr[1:])
+
+        doc_freq = np.diff(indptr).astype(np.float32)
+        idf = np.log1p((len(ids) - doc_freq + 0.5) / (doc_freq + 0.5))
+        avg_length = doc_lengths.mean() if len(ids) else 1.0
+        norm = K1 * (1 - B + B * doc_lengths[doc_ids] / max(avg_length, 1.0))
+        weights = (idf[terms] * tf * (K1 + 1) / (tf + norm)).astype(np.float32)
+
+        version, version_dir = new_version(self.index_dir)
+        np.savez(os.path.join(version_dir, "postings.npz"), indptr=indptr, doc_ids=doc_ids, weights=weights)
+        with open(os.path.join(version_dir, "rows.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "terms": sorted(vocabulary, key=vocabulary.get),
+                "ids": list(ids),
+                "documents": list(documents),
+                "metadatas": list(metadatas),
+            }, f)
+        publish_version(self.index_dir, version)
+        self.refresh()
+
+    def build_from_collection(self, collection, data=None):
+        data = data or collection.get(include=["documents", "metadatas"])
+        self.build(data["ids"], data["documents"], data["metadatas"])
+        print(f"BM25 index rebuilt: {self.count()} rows, {len(self.vocabulary)} terms")
+
+    def scores(self, query):
+        """BM25 score of every row for the query text."""
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids:
+            return np.zeros(len(self.ids), dtype=np.float32)
+        slices = [np.arange(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        postings = np.concatenate(slices)
+        return np.bincount(self.doc_ids[postings], weights=self.weights[postings], minlength=len(self.ids))
+
+    def query(self, query_texts, n_results=10, where=None):
+        """Same result layout as collection.query(); rows without a matching term are left out."""
+        self.refresh()
+        mask = self.filters.where_mask(where)
+        results = {"ids": [], "documents": [], "metadatas": [], "scores": []}
+        for query in query_texts:
+            scores = np.where(mask, self.scores(query), 0.0)
+            candidates = np.flatnonzero(scores > 0)
+            k = min(n_results, len(candidates))
+            top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+            results["ids"].append([self.ids[i] for i in top])
+            results["documents"].append([self.documents[i] for i in top])
+            results["metadatas"].append([self.metadatas[i] for i in top])
+            results["scores"].append([float(scores[i]) for i in top])
+        return results
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merges ranked id lists into [(id, score)], best first,
+    where score(id) = sum over rankings of 1 / (k + rank).
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda entry: -entry[1])
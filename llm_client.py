@@ -0,0 +1,349 @@
+# llm_client.py
+import asyncio
+import email.utils
+import os
+import queue
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+from context_packer import count_tokens
+
+# Defaults, overridable through the environment (see LLMClient.from_env)
+MAX_CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 200000
+MAX_RETRIES = 5
+DEADLINE_SECONDS = 180
+CONNECT_TIMEOUT = 10
+
+# Backoff between retries: full jitter on BACKOFF_BASE * 2**attempt, capped at BACKOFF_MAX
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Allows `rate` units per minute with bursts up to one minute's worth.
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate):
+        self.capacity = float(rate)
+        self.rate = rate / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount):
+        amount = min(float(amount), self.capacity)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def refund(self, amount):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def retry_after_seconds(error):
+    """Server-requested wait from Retry-After / retry-after-ms headers, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value)
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+def usage_tokens(usage):
+    """Prompt, cached prompt and completion tokens of a response's usage, zeros if missing."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+    }
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+class LLMClient:
+    """
+    Chat completions through one AsyncOpenAI client running on a background event loop.
+
+    All callers, whatever thread they run on, share the pooled HTTP connections,
+    a concurrency limit and requests-per-minute / tokens-per-minute token buckets.
+    Retryable failures (429, 5xx, timeouts, dropped connections) are retried with
+    jittered exponential backoff, waiting at least as long as Retry-After asks, until
+    the call's deadline. chat() and stream_chat() are blocking wrappers for sync code.
+    """
+
+    def __init__(self, api_key=None, base_url=None, max_concurrency=MAX_CONCURRENCY,
+                 requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_retries=MAX_RETRIES, deadline=DEADLINE_SECONDS):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.counters = {
+            "queued": 0, "max_queued": 0, "in_flight": 0, "requests": 0, "completed": 0,
+            "retries": 0, "rate_limited": 0, "timeouts": 0, "failures": 0, "total_latency": 0.0,
+            "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+        }
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", MAX_CONCURRENCY)),
+            requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", REQUESTS_PER_MINUTE)),
+            tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", TOKENS_PER_MINUTE)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", MAX_RETRIES)),
+            deadline=float(os.getenv("LLM_DEADLINE_SECONDS", DEADLINE_SECONDS)),
+        )
+
+    # Background event loop
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+            http_client = openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+            # Retries are handled here, against the shared limits, not inside the SDK
+            self._client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                              http_client=http_client, max_retries=0,
+                                              timeout=openai.Timeout(self.deadline, connect=CONNECT_TIMEOUT))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+            return loop
+
+    def run(self, coroutine):
+        """Runs a coroutine on the client's loop and waits for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop()).result()
+
+    # Metrics
+    def metrics(self):
+        snapshot = dict(self.counters)
+        completed = snapshot.pop("total_latency")
+        snapshot["avg_latency"] = round(completed / snapshot["completed"], 3) if snapshot["completed"] else 0.0
+        snapshot["cached_ratio"] = (round(snapshot["cached_tokens"] / snapshot["prompt_tokens"], 3)
+                                    if snapshot["prompt_tokens"] else 0.0)
+        return snapshot
+
+    def _record_usage(self, usage):
+        for name, value in usage_tokens(usage).items():
+            self.counters[name] += value
+
+    def _estimate_tokens(self, kwargs):
+        prompt_tokens = sum(count_tokens(message.get("content") or "") + 4 for message in kwargs.get("messages", []))
+        return prompt_tokens + int(kwargs.get("max_tokens") or 0)
+
+    async def _admit(self, estimate):
+        """Waits for a concurrency slot and rate-limit budget."""
+        self.counters["queued"] += 1
+        self.counters["max_queued"] = max(self.counters["max_queued"], self.counters["queued"])
+        try:
+            await self._semaphore.acquire()
+            try:
+                await self.request_bucket.acquire(1)
+                await self.token_bucket.acquire(estimate)
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.counters["queued"] -= 1
+        self.counters["in_flight"] += 1
+
+    def _release(self):
+        self.counters["in_flight"] -= 1
+        self._semaphore.release()
+
+    async def _backoff(self, error, attempt, deadline):
+        """Sleeps before the next attempt, or re-raises if retrying is pointless or too late."""
+        if isinstance(error, openai.RateLimitError):
+            self.counters["rate_limited"] += 1
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self.counters["failures"] += 1
+            raise error
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        server_delay = retry_after_seconds(error)
+        if server_delay is not None:
+            delay = server_delay + random.uniform(0, BACKOFF_BASE)
+        if time.monotonic() + delay >= deadline:
+            self.counters["failures"] += 1
+            raise error
+        self.counters["retries"] += 1
+        print(f"LLM call failed ({error.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    async def achat(self, deadline=None, **kwargs):
+        """chat.completions.create(**kwargs) with limits, retries and a deadline in seconds."""
+        self._ensure_loop()
+        deadline = time.monotonic() + (deadline or self.deadline)
+        estimate = self._estimate_tokens(kwargs)
+        self.counters["requests"] += 1
+        attempt = 0
+        while True:
+            await self._admit(estimate)
+            started = time.monotonic()
+            try:
+                response = await asyncio.wait_for(self._client.chat.completions.create(**kwargs), deadline - started)
+            except asyncio.TimeoutError:
+                self._release()
+                self.counters["timeouts"] += 1
+                self.counters["failures"] += 1
+                raise TimeoutError("LLM call exceeded its deadline")
+            except openai.APIError as e:
+                self._release()
+                await self._backoff(e, attempt, deadline)
+                attempt += 1
+                continue
+            except BaseException:
+                self._release()
+                raise
+            self._release()
+            self.counters["completed"] += 1
+            self.counters["total_latency"] += time.monotonic() - started
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                self._record_usage(usage)
+                if usage.total_tokens is not None:
+                    self.token_bucket.refund(max(0, estimate - usage.total_tokens))
+            return response
+
+    async def astream_chat(self, deadline=None, **kwargs):
+        """
+        Async iterator over streamed chunks. Failures before the first chunk are
+        retried like achat; once text has been yielded a failure is raised.
+        Usage is always requested, so the last chunk carries token usage and no
+        choices; the tokens-per-minute estimate is settled against it like in achat.
+        """
+        self._ensure_loop()
+        deadline = time.monotonic() + (deadline or self.deadline)
+        kwargs["stream_options"] = dict(kwargs.get("stream_options") or {}, include_usage=True)
+        estimate = self._estimate_tokens(kwargs)
+        self.counters["requests"] += 1
+        attempt = 0
+        while True:
+            await self._admit(estimate)
+            started = time.monotonic()
+            yielded = False
+            try:
+                stream = await asyncio.wait_for(
+                    self._client.chat.completions.create(stream=True, **kwargs), deadline - started)
+                try:
+                    iterator = stream.__aiter__()
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+                        except StopAsyncIteration:
+                            break
+                        yielded = True
+                        usage = getattr(chunk, "usage", None)
+                        if usage is not None:
+                            self._record_usage(usage)
+                            if usage.total_tokens is not None:
+                                self.token_bucket.refund(max(0, estimate - usage.total_tokens))
+                        yield chunk
+                finally:
+                    # Hands the connection back to the pool, also when the consumer stops early
+                    await stream.close()
+            except asyncio.TimeoutError:
+                self._release()
+                self.counters["timeouts"] += 1
+                self.counters["failures"] += 1
+                raise TimeoutError("LLM stream exceeded its deadline")
+            except openai.APIError as e:
+                if yielded:
+                    self._release()
+                    self.counters["failures"] += 1
+                    raise
+                self._release()
+                await self._backoff(e, attempt, deadline)
+                attempt += 1
+                continue
+            except BaseException:
+                self._release()
+                raise
+            self._release()
+            self.counters["completed"] += 1
+            self.counters["total_latency"] += time.monotonic() - started
+            return
+
+    # Blocking wrappers
+    def chat(self, deadline=None, **kwargs):
+        return self.run(self.achat(deadline=deadline, **kwargs))
+
+    def stream_chat(self, deadline=None, **kwargs):
+        """Blocking iterator over streamed chunks, fed from the client's loop."""
+        loop = self._ensure_loop()
+        chunks = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in self.astream_chat(deadline=deadline, **kwargs):
+                    chunks.put(chunk)
+            except BaseException as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                item = chunks.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # The consumer stopped early: stop the request too
+            future.cancel()
@@ -0,0 +1,367 @@
+# markdown_docx.py
+"""
+Renders generated Markdown into a python-docx Document in a single pass.
+
+Blocks: headings, paragraphs, bullet and numbered lists nested by indentation,
+pipe tables, block quotes, fenced code and horizontal rules. Inline: bold, italic,
+bold italic, code spans and links (kept as their text). Everything maps to the
+built-in Word styles, so documents pick up the look of whatever template they
+are created from.
+
+    python markdown_docx.py [pages]    # benchmark on a synthetic strategy
+"""
+import re
+
+from docx.oxml.table import CT_Tbl
+from lxml import etree
+
+# Nested lists use the "List Bullet 2" / "List Number 3" styles; deeper levels are flattened
+MAX_LIST_DEPTH = 3
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+LIST_RE = re.compile(r"^(\s*)([-*+•·]|(\d{1,9})[.)])\s+(.*)$")
+TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+CODE_FONT = "Consolas"
+
+# Characters that are not allowed in XML 1.0; dropped rather than failing the export
+INVALID_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+# Alternatives in priority order (backslash escapes first); bold and italic contents are
+# parsed again for nesting
+INLINE_RE = re.compile(
+    r"\\(?P<escaped>[\\`*_{}\[\]()#+\-.!|>])"
+    r"|(?P<bolditalic>\*\*\*(?=\S)(?P<bi>.+?)(?<=\S)\*\*\*)"
+    r"|(?P<bold>\*\*(?=\S)(?P<b>.+?)(?<=\S)\*\*|__(?=\S)(?P<b2>.+?)(?<=\S)__)"
+    r"|(?P<italic>(?<![\w*])\*(?=\S)(?P<i>.+?)(?<=\S)\*(?!\*)|(?<!\w)_(?=\S)(?P<i2>.+?)(?<=\S)_(?!\w))"
+    r"|(?P<code>`(?P<c>[^`]+)`)"
+    r"|(?P<link>\[(?P<text>[^\]]+)\]\((?P<url>[^)\s]+)\))"
+)
+
+INLINE_MARKUP_RE = re.compile(r"[*_`\[\\]")
+
+# Tokenizer
+def parse_inline(text, bold=False, italic=False):
+    """Splits inline Markdown into (text, bold, italic, code) runs."""
+    if not INLINE_MARKUP_RE.search(text):
+        return [(text, bold, italic, False)]
+    runs = []
+    position = 0
+    for match in INLINE_RE.finditer(text):
+        if match.start() > position:
+            runs.append((text[position:match.start()], bold, italic, False))
+        if match.group("escaped"):
+            runs.append((match.group("escaped"), bold, italic, False))
+        elif match.group("bolditalic"):
+            runs.extend(parse_inline(match.group("bi"), True, True))
+        elif match.group("bold"):
+            runs.extend(parse_inline(match.group("b") or match.group("b2"), True, italic))
+        elif match.group("italic"):
+            runs.extend(parse_inline(match.group("i") or match.group("i2"), bold, True))
+        elif match.group("code"):
+            runs.append((match.group("c"), bold, italic, True))
+        else:
+            runs.extend(parse_inline(match.group("text"), bold, italic))
+        position = match.end()
+    if position < len(text):
+        runs.append((text[position:], bold, italic, False))
+    return runs
+
+
+def split_row(line):
+    """Cells of a pipe table row, honouring escaped pipes."""
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in re.split(r"(?<!\\)\|", line)]
+
+
+def tokenize(markdown):
+    """
+    Yields the blocks of a Markdown document in order:
+    ("heading", level, text), ("paragraph", text), ("list_item", ordered, depth, start, text),
+    ("table", rows), ("quote", text), ("code", text), ("rule",) and ("blank",).
+    Every line is looked at once; tables and code blocks are read ahead.
+    """
+    lines = markdown.replace("\r\n", "\n").split("\n")
+    indents = []  # indentation of the open list levels
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        i += 1
+        if not stripped:
+            yield ("blank",)
+            continue
+
+        if FENCE_RE.match(line):
+            fence = FENCE_RE.match(line).group(1)
+            code = []
+            while i < len(lines) and not lines[i].strip().startswith(fence):
+                code.append(lines[i])
+                i += 1
+            i += 1  # closing fence
+            indents = []
+            yield ("code", "\n".join(code))
+            continue
+
+        heading = HEADING_RE.match(stripped)
+        if heading:
+            indents = []
+            yield ("heading", len(heading.group(1)), heading.group(2))
+            continue
+
+        if stripped.startswith("|") and i < len(lines) and TABLE_SEPARATOR_RE.match(lines[i]):
+            rows = [split_row(stripped)]
+            i += 1
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                rows.append(split_row(lines[i]))
+                i += 1
+            indents = []
+            yield ("table", rows)
+            continue
+
+        if RULE_RE.match(stripped):
+            indents = []
+            yield ("rule",)
+            continue
+
+        item = LIST_RE.match(line)
+        if item:
+            indent = len(item.group(1).expandtabs(4))
+            while indents and indent < indents[-1]:
+                indents.pop()
+            if not indents or indent > indents[-1]:
+                indents.append(indent)
+            number = item.group(3)
+            yield ("list_item", number is not None, len(indents) - 1, int(number) if number else 1, item.group(4))
+            continue
+
+        if stripped.startswith(">"):
+            indents = []
+            yield ("quote", stripped.lstrip("> ").strip())
+            continue
+
+        if indents and line[:1].isspace():
+            # Indented text under a list item continues it
+            yield ("list_item_text", stripped)
+            continue
+
+        indents = []
+        yield ("paragraph", stripped)
+
+
+# Rendering
+class DocxRenderer:
+    """
+    Writes tokenized Markdown into a python-docx Document. Style ids are looked up once
+    and paragraphs and runs are built directly as WordprocessingML elements, since
+    python-docx resolves styles and child order on every call. Each numbered list gets
+    its own Word numbering instance so it restarts at its first number instead of
+    continuing the previous list.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        styles = {style.name: style for style in doc.styles}
+        self.styles = {"Quote": styles.get("Quote"), "Table Grid": styles.get("Table Grid")}
+        for kind in ("Bullet", "Number"):
+            for depth in range(MAX_LIST_DEPTH):
+                name = f"List {kind}" + (f" {depth + 1}" if depth else "")
+                self.styles[(kind, depth)] = styles.get(name) or styles.get(f"List {kind}")
+        for level in range(1, 10):
+            self.styles[("Heading", level)] = styles.get(f"Heading {level}")
+        self.style_ids = {key: style.style_id for key, style in self.styles.items() if style is not None}
+        self.body = doc.element.body
+        self.sect_pr = self.body.sectPr  # content goes before the final section properties
+        section = doc.sections[-1]  # tables span the text width of the last section
+        self.block_width = section.page_width - section.left_margin - section.right_margin
+        self.numbering = None
+        self.next_num_id = None
+        self.abstract_nums = {}  # list style key -> its abstract numbering definition
+        self.list_numbers = {}  # depth -> numbering instance of the open numbered list
+        self.last_item = None
+
+    def render(self, markdown):
+        for block in tokenize(markdown):
+            kind = block[0]
+            if kind == "blank":
+                continue
+            if kind not in ("list_item", "list_item_text"):
+                self.list_numbers = {}
+                self.last_item = None
+            getattr(self, "_" + kind)(*block[1:])
+        return self.doc
+
+    def _append(self, element):
+        if self.sect_pr is not None:
+            self.sect_pr.addprevious(element)
+        else:
+            self.body.append(element)
+        return element
+
+    def _add_paragraph(self, style_key=None, num_id=None):
+        """A new <w:p> at the end of the body, with its style and list numbering."""
+        p = self._append(self.body.makeelement(W + "p", {}))
+        style_id = self.style_ids.get(style_key)
+        if style_id or num_id is not None:
+            p_pr = etree.SubElement(p, W + "pPr")
+            if style_id:
+                etree.SubElement(p_pr, W + "pStyle", {W + "val": style_id})
+            if num_id is not None:
+                num_pr = etree.SubElement(p_pr, W + "numPr")
+                etree.SubElement(num_pr, W + "ilvl", {W + "val": "0"})
+                etree.SubElement(num_pr, W + "numId", {W + "val": str(num_id)})
+        return p
+
+    @staticmethod
+    def _add_run(p, text, bold=False, italic=False, code=False):
+        r = etree.SubElement(p, W + "r")
+        if bold or italic or code:
+            r_pr = etree.SubElement(r, W + "rPr")
+            if code:
+                etree.SubElement(r_pr, W + "rFonts", {W + "ascii": CODE_FONT, W + "hAnsi": CODE_FONT})
+            if bold:
+                etree.SubElement(r_pr, W + "b")
+            if italic:
+                etree.SubElement(r_pr, W + "i")
+        for i, line in enumerate(text.split("\n")):
+            if i:
+                etree.SubElement(r, W + "br")
+            t = etree.SubElement(r, W + "t")
+            t.text = INVALID_XML_RE.sub("", line)
+            if line != line.strip():
+                t.set(XML_SPACE, "preserve")
+        return r
+
+    def _runs(self, p, text):
+        for run_text, bold, italic, code in parse_inline(text):
+            self._add_run(p, run_text, bold, italic, code)
+
+    def _heading(self, level, text):
+        self._runs(self._add_paragraph(("Heading", min(level, 9))), text)
+
+    def _paragraph(self, text):
+        self._runs(self._add_paragraph(), text)
+
+    def _quote(self, text):
+        self._runs(self._add_paragraph("Quote"), text)
+
+    def _code(self, text):
+        self._add_run(self._add_paragraph(), text, code=True)
+
+    def _rule(self):
+        # Section separators in the drafts; headings already separate the content
+        pass
+
+    def _list_item(self, ordered, depth, start, text):
+        depth = min(depth, MAX_LIST_DEPTH - 1)
+        for deeper in [d for d in self.list_numbers if d > depth]:
+            del self.list_numbers[deeper]
+        style_key = ("Number" if ordered else "Bullet", depth)
+        num_id = None
+        if ordered:
+            if depth not in self.list_numbers:
+                self.list_numbers[depth] = self._restart_numbering(style_key, start)
+            num_id = self.list_numbers[depth]
+        else:
+            self.list_numbers.pop(depth, None)
+        p = self._add_paragraph(style_key, num_id)
+        self._runs(p, text)
+        self.last_item = p
+
+    def _list_item_text(self, text):
+        if self.last_item is None:
+            return self._paragraph(text)
+        etree.SubElement(etree.SubElement(self.last_item, W + "r"), W + "br")
+        self._runs(self.last_item, text)
+
+    def _restart_numbering(self, style_key, start):
+        """A new numbering instance of the list style's definition, starting at `start`."""
+        if self.numbering is None:
+            self.numbering = self.doc.part.numbering_part.element
+            self.next_num_id = max([num.numId for num in self.numbering.num_lst] + [0]) + 1
+        if style_key not in self.abstract_nums:
+            style = self.styles[style_key]
+            style_pr = style.element.pPr if style is not None else None
+            abstract_num = None
+            if style_pr is not None and style_pr.numPr is not None and style_pr.numPr.numId is not None:
+                abstract_num = self.numbering.num_having_numId(style_pr.numPr.numId.val).abstractNumId.val
+            self.abstract_nums[style_key] = abstract_num
+        if self.abstract_nums[style_key] is None:
+            return None
+        num_id = self.next_num_id
+        self.next_num_id += 1
+        num = etree.SubElement(self.numbering, W + "num", {W + "numId": str(num_id)})
+        etree.SubElement(num, W + "abstractNumId", {W + "val": str(self.abstract_nums[style_key])})
+        override = etree.SubElement(num, W + "lvlOverride", {W + "ilvl": "0"})
+        etree.SubElement(override, W + "startOverride", {W + "val": str(start)})
+        return num_id
+
+    def _table(self, rows):
+        columns = max(len(row) for row in rows)
+        tbl = self._append(CT_Tbl.new_tbl(len(rows), columns, self.block_width))
+        if "Table Grid" in self.style_ids:
+            tbl.tblPr.style = self.style_ids["Table Grid"]
+        for row_index, (row, tr) in enumerate(zip(rows, tbl.tr_lst)):
+            for text, tc in zip(row, tr.tc_lst):
+                self._runs(tc.p_lst[0], f"**{text}**" if row_index == 0 and text else text)
+
+
+def render_markdown(doc, markdown):
+    """Appends the Markdown to doc and returns it."""
+    return DocxRenderer(doc).render(markdown)
+
+
+# Benchmark
+def sample_strategy(pages=100):
+    """A synthetic draft of roughly `pages` pages using every block type the drafts use."""
+    page = """# Section {n}
+
+Intro paragraph with **bold text**, *italic text* and a [link](https://example.com) in it. {filler}
+
+## Subsection {n}.1
+
+- **Attribute:** reliable and *consistent* delivery
+- Second bullet with `code`
+  - Nested bullet
+  - Another nested bullet
+1. First step
+2. Second step
+3. Third step
+
+| Characteristic | Description | Do's | Don'ts |
+|---|---|---|---|
+| Warm | Friendly and approachable | Use first names | Sound robotic |
+| Expert | Confident and precise | Cite data | Overpromise |
+
+{filler}
+"""
+    filler = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor. " * 6
+    return "\n".join(page.format(n=n, filler=filler) for n in range(1, pages + 1))
+
+
+if __name__ == "__main__":
+    import io
+    import sys
+    import time
+
+    from docx import Document
+
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    markdown = sample_strategy(pages)
+    started = time.perf_counter()
+    blocks = sum(1 for _ in tokenize(markdown))
+    tokenized = time.perf_counter()
+    doc = render_markdown(Document(), markdown)
+    rendered = time.perf_counter()
+    doc.save(io.BytesIO())
+    saved = time.perf_counter()
+    print(f"{pages} pages, {len(markdown)} characters, {blocks} blocks")
+    print(f"tokenize {tokenized - started:.3f}s, render {rendered - tokenized:.3f}s, save {saved - rendered:.3f}s")
@@ -0,0 +1,303 @@
+# ooxml_writer.py
+"""
+Streams a draft straight into a .docx file, without the python-docx object model.
+
+The package is built from the branded base (branded_base.py), rebuilt whenever the
+template changes, or python-docx's default template when there is no brand template:
+every part except word/document.xml and word/numbering.xml is compressed into a
+skeleton zip. Each export copies that skeleton, appends numbering.xml and writes
+word/document.xml block by block while the Markdown is tokenized, so the compressed
+styles and theme are reused and memory stays flat however long the document is.
+The output has the same title block, styles and lists as generator2.export_to_word.
+
+    python ooxml_writer.py [pages]    # benchmark against export_to_word's renderer
+"""
+import io
+import os
+import threading
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+from lxml import etree
+
+from branded_base import BRAND_TEMPLATE_PATH, base_bytes
+from markdown_docx import INVALID_XML_RE, MAX_LIST_DEPTH, W, parse_inline, tokenize
+
+DOCUMENT_PART = "word/document.xml"
+NUMBERING_PART = "word/numbering.xml"
+
+# Flush the document.xml buffer to the zip stream at about this many characters
+FLUSH_CHARS = 64 * 1024
+
+_skeleton = None
+_skeleton_base = None  # the base_bytes the skeleton was built from
+_skeleton_lock = threading.Lock()
+
+
+class Skeleton:
+    """The static parts of the package plus what the writer needs from them."""
+
+    def __init__(self, package):
+        with zipfile.ZipFile(io.BytesIO(package)) as source:
+            parts = {info.filename: source.read(info.filename) for info in source.infolist()}
+        # Empty the body down to its section properties and split it where the blocks go
+        root = etree.fromstring(parts.pop(DOCUMENT_PART))
+        body = root.find(W + "body")
+        sect = body.find(W + "sectPr")
+        for child in list(body):
+            if child is not sect:
+                body.remove(child)
+        body.insert(0, etree.Comment("blocks"))
+        document = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True).decode("utf-8")
+        self.document_head, self.document_tail = document.split("<!--blocks-->")
+
+        # Style ids by lowercased name (built-in styles are stored as "heading 1"), and
+        # each list style's abstract numbering definition
+        styles = etree.fromstring(parts["word/styles.xml"])
+        numbering = etree.fromstring(parts[NUMBERING_PART])
+        self.style_ids = {}
+        style_nums = {}
+        for style in styles.iter(W + "style"):
+            name = style.find(W + "name")
+            if name is None:
+                continue
+            self.style_ids[name.get(W + "val").lower()] = style.get(W + "styleId")
+            num_id = style.find(f"{W}pPr/{W}numPr/{W}numId")
+            if num_id is not None:
+                style_nums[name.get(W + "val").lower()] = num_id.get(W + "val")
+        abstract_nums = {num.get(W + "numId"): num.find(W + "abstractNumId").get(W + "val")
+                         for num in numbering.iter(W + "num")}
+        self.abstract_nums = {name: abstract_nums.get(num_id) for name, num_id in style_nums.items()}
+        self.next_num_id = max([int(num_id) for num_id in abstract_nums] + [0]) + 1
+        self.numbering = parts.pop(NUMBERING_PART).decode("utf-8")
+
+        # Usable text width for table columns, in twentieths of a point
+        page, margins = sect.find(W + "pgSz"), sect.find(W + "pgMar")
+        self.block_width = int(page.get(W + "w")) - int(margins.get(W + "left")) - int(margins.get(W + "right"))
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as package_zip:
+            for name, data in parts.items():
+                package_zip.writestr(name, data)
+        self.package = buffer.getvalue()
+
+
+def get_skeleton():
+    """The skeleton of the current branded base, rebuilt when base_bytes returns a new one."""
+    global _skeleton, _skeleton_base
+    base = None
+    if os.path.exists(BRAND_TEMPLATE_PATH):
+        try:
+            base = base_bytes(BRAND_TEMPLATE_PATH)
+        except Exception as e:
+            print(f"Could not build the branded base from {BRAND_TEMPLATE_PATH}, using the default template: {e}")
+    with _skeleton_lock:
+        if _skeleton is None or base is not _skeleton_base:
+            if base is None:
+                from docx import Document
+                buffer = io.BytesIO()
+                Document().save(buffer)
+                _skeleton = Skeleton(buffer.getvalue())
+            else:
+                _skeleton = Skeleton(base)
+            _skeleton_base = base
+        return _skeleton
+
+
+def _text(text):
+    return escape(INVALID_XML_RE.sub("", text))
+
+
+class OoxmlWriter:
+    """
+    Writes tokenized Markdown as WordprocessingML to a text stream. Mirrors
+    markdown_docx.DocxRenderer: same styles, nesting and numbering restarts.
+    """
+
+    def __init__(self, skeleton, stream):
+        self.skeleton = skeleton
+        self.stream = stream
+        self.buffer = []
+        self.buffered = 0
+        self.nums = []  # <w:num> elements to add to numbering.xml
+        self.next_num_id = skeleton.next_num_id
+        self.list_numbers = {}
+
+    # Output
+    def _write(self, xml):
+        self.buffer.append(xml)
+        self.buffered += len(xml)
+        if self.buffered >= FLUSH_CHARS:
+            self.flush()
+
+    def flush(self):
+        self.stream.write("".join(self.buffer).encode("utf-8"))
+        self.buffer, self.buffered = [], 0
+
+    def _style(self, name):
+        return self.skeleton.style_ids.get(name.lower())
+
+    def _run(self, text, bold=False, italic=False, code=False):
+        properties = ""
+        if code:
+            properties += '<w:rFonts w:ascii="Consolas" w:hAnsi="Consolas"/>'
+        if bold:
+            properties += "<w:b/>"
+        if italic:
+            properties += "<w:i/>"
+        pieces = []
+        for i, line in enumerate(text.split("\n")):
+            if i:
+                pieces.append("<w:br/>")
+            space = ' xml:space="preserve"' if line != line.strip() else ""
+            pieces.append(f"<w:t{space}>{_text(line)}</w:t>")
+        return f"<w:r>{'<w:rPr>' + properties + '</w:rPr>' if properties else ''}{''.join(pieces)}</w:r>"
+
+    def _runs(self, text):
+        return "".join(self._run(*run) for run in parse_inline(text))
+
+    def _paragraph(self, content, style=None, num_id=None):
+        properties = ""
+        style_id = self._style(style) if style else None
+        if style_id:
+            properties += f"<w:pStyle w:val={quoteattr(style_id)}/>"
+        if num_id is not None:
+            properties += f'<w:numPr><w:ilvl w:val="0"/><w:numId w:val="{num_id}"/></w:numPr>'
+        self._write(f"<w:p>{'<w:pPr>' + properties + '</w:pPr>' if properties else ''}{content}</w:p>")
+
+    # Blocks
+    def render(self, markdown):
+        pending_item = None  # list items stay open for indented continuation lines
+        for block in tokenize(markdown):
+            kind = block[0]
+            if kind == "blank":
+                continue
+            if kind == "list_item_text" and pending_item is not None:
+                pending_item[1].append('<w:r><w:br/></w:r>' + self._runs(block[1]))
+                continue
+            if pending_item is not None:
+                self._paragraph("".join(pending_item[1]), *pending_item[0])
+                pending_item = None
+            if kind == "list_item":
+                pending_item = self._list_item(*block[1:])
+                continue
+            self.list_numbers = {}
+            if kind == "heading":
+                self._paragraph(self._runs(block[2]), f"Heading {min(block[1], 9)}")
+            elif kind in ("paragraph", "list_item_text"):
+                self._paragraph(self._runs(block[1]))
+            elif kind == "quote":
+                self._paragraph(self._runs(block[1]), "Quote")
+            elif kind == "code":
+                self._paragraph(self._run(block[1], code=True))
+            elif kind == "table":
+                self._table(block[1])
+        if pending_item is not None:
+            self._paragraph("".join(pending_item[1]), *pending_item[0])
+
+    def _list_item(self, ordered, depth, start, text):
+        """Returns ((style, num_id), [content]) for the caller to write once complete."""
+        depth = min(depth, MAX_LIST_DEPTH - 1)
+        for deeper in [d for d in self.list_numbers if d > depth]:
+            del self.list_numbers[deeper]
+        kind = "Number" if ordered else "Bullet"
+        style = f"List {kind}" + (f" {depth + 1}" if depth else "")
+        if self._style(style) is None:
+            style = f"List {kind}"
+        num_id = None
+        if ordered:
+            if depth not in self.list_numbers:
+                self.list_numbers[depth] = self._restart_numbering(style, start)
+            num_id = self.list_numbers[depth]
+        else:
+            self.list_numbers.pop(depth, None)
+        return (style, num_id), [self._runs(text)]
+
+    def _restart_numbering(self, style, start):
+        abstract_num = self.skeleton.abstract_nums.get(style.lower())
+        if abstract_num is None:
+            return None
+        num_id = self.next_num_id
+        self.next_num_id += 1
+        self.nums.append(f'<w:num w:numId="{num_id}"><w:abstractNumId w:val="{abstract_num}"/>'
+                         f'<w:lvlOverride w:ilvl="0"><w:startOverride w:val="{start}"/></w:lvlOverride></w:num>')
+        return num_id
+
+    def _table(self, rows):
+        columns = max(len(row) for row in rows)
+        width = self.skeleton.block_width // columns
+        style_id = self._style("Table Grid")
+        parts = ["<w:tbl><w:tblPr>"]
+        if style_id:
+            parts.append(f"<w:tblStyle w:val={quoteattr(style_id)}/>")
+        parts.append('<w:tblW w:type="auto" w:w="0"/><w:tblLook w:firstColumn="1" w:firstRow="1" '
+                     'w:lastColumn="0" w:lastRow="0" w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr>')
+        parts.append("<w:tblGrid>" + f'<w:gridCol w:w="{width}"/>' * columns + "</w:tblGrid>")
+        for row_index, row in enumerate(rows):
+            parts.append("<w:tr>")
+            for text in row + [""] * (columns - len(row)):
+                content = self._runs(f"**{text}**" if row_index == 0 and text else text)
+                parts.append(f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width}"/></w:tcPr><w:p>{content}</w:p></w:tc>')
+            parts.append("</w:tr>")
+        parts.append("</w:tbl>")
+        self._write("".join(parts))
+
+
+def write_docx(markdown_text, client_name, output):
+    """
+    Writes the draft as a .docx to output, a path or a seekable binary file, with the
+    same title block as generator2.export_to_word.
+    """
+    skeleton = get_skeleton()
+    if isinstance(output, str):
+        with open(output, "w+b") as f:
+            return write_docx(markdown_text, client_name, f)
+    start = output.tell()
+    output.write(skeleton.package)
+    output.seek(start)
+    with zipfile.ZipFile(output, "a", zipfile.ZIP_DEFLATED) as package_zip:
+        with package_zip.open(DOCUMENT_PART, "w") as stream:
+            writer = OoxmlWriter(skeleton, stream)
+            writer._write(skeleton.document_head)
+            writer._paragraph(writer._runs(f"{client_name} - Strategy Document"), "Title")
+            writer._paragraph(writer._runs(f"Generated on: {datetime.now().strftime('%B %d, %Y')}"))
+            writer._paragraph("")
+            writer.render(markdown_text)
+            writer._write(skeleton.document_tail)
+            writer.flush()
+        numbering = skeleton.numbering.replace("</w:numbering>", "".join(writer.nums) + "</w:numbering>")
+        package_zip.writestr(NUMBERING_PART, numbering)
+    return output
+
+
+def export_to_docx(markdown_text, client_name):
+    """Drop-in for generator2.export_to_word: returns a BytesIO positioned at the start."""
+    buffer = io.BytesIO()
+    write_docx(markdown_text, client_name, buffer)
+    buffer.seek(0)
+    return buffer
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from branded_base import new_document
+    from markdown_docx import render_markdown, sample_strategy
+
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    markdown = sample_strategy(pages)
+    get_skeleton()
+
+    started = time.perf_counter()
+    doc = new_document()
+    render_markdown(doc, markdown)
+    doc.save(io.BytesIO())
+    python_docx = time.perf_counter() - started
+
+    started = time.perf_counter()
+    size = len(export_to_docx(markdown, "Benchmark").getvalue())
+    streamed = time.perf_counter() - started
+    print(f"{pages} pages: python-docx {python_docx:.3f}s, streaming writer {streamed:.3f}s "
+          f"({python_docx / streamed:.1f}x), {size} bytes")
@@ -0,0 +1,360 @@
+# outlines.py
+import re
+
+# Fixed section outlines of the generated documents, in output order.
+# "query" describes the section for matching it to template chunks, "questions" are the
+# intake answers the section is written from and "instructions" is its part of the prompt.
+# These are the only copy of the outlines: the whole-document prompts list them through
+# outline_prompt() and the section prompts take one section each.
+
+SECTION_OUTLINES = {
+    "brand": [
+        {
+            "title": "Company Description",
+            "query": "Company description: overview of the company, its background, industry position and what it does",
+            "questions": ["company_overview", "additional_context"],
+            "instructions": "[Detailed overview of the company, its background, industry position, and what they do]",
+        },
+        {
+            "title": "Brand Wheel",
+            "query": "Brand wheel: attributes, benefits, values, personality and essence of the brand",
+            "questions": ["brand_wheel"],
+            "instructions": """One essential part of the brand development process is the "brand wheel," a templated approach to understanding your brand by breaking it down into five categories:
+
+## Attributes
+[List 3-5 key brand attributes]
+
+## Benefits
+[List 3-5 benefits the brand provides to customers]
+
+## Values
+[List 3-5 core brand values]
+
+## Personality
+[List 3-5 personality traits of the brand]
+
+## Essence
+[Single phrase or word that captures the brand essence]""",
+        },
+        {
+            "title": "Audience Personas",
+            "query": "Audience personas: fictional customer profiles with demographics, background, goals, challenges and motivations",
+            "questions": ["target_personas"],
+            "instructions": """Your Audience Personas should epitomize your customer base. These fictional profiles will help to ensure your brand and marketing efforts will appeal to your audience.
+
+[Create 2-3 detailed personas with:]
+- Demographics (age, education, location, income)
+- Background
+- Goals
+- Challenges
+- Motivations""",
+        },
+        {
+            "title": "Competitor Research",
+            "query": "Competitor research: profiling competitors, what they offer, their strengths and key learnings",
+            "questions": ["competitors"],
+            "instructions": """Profiling your competitors gives people a unique insight into your industry.
+
+[Analyze 2-3 key competitors:]
+- Company name and overview
+- What they offer
+- Their strengths
+- Key learnings""",
+        },
+        {
+            "title": "Brand Positioning",
+            "query": "Brand positioning statement: the only category that delivers a benefit to customers",
+            "questions": ["positioning"],
+            "instructions": """Brand positioning is the process of placing your brand in the minds of your customers.
+
+**Using the following formula:** [Brand Name]'s [offering] is the only [category/service/product] that [benefit you bring to your customers].
+
+[Write the positioning statement]""",
+        },
+        {
+            "title": "Brand Story",
+            "query": "Brand story: emotional narrative, purpose and customer pain points the brand solves",
+            "questions": ["brand_story"],
+            "instructions": """Your Brand Story is unique to you -- it can be funny, unexpected, serious, ambitious... but one thing is for sure: it must spark an emotional reaction. Include the direct pain points that you solve for customers.
+
+[Write a compelling 2-3 paragraph brand story]""",
+        },
+        {
+            "title": "Brand Values",
+            "query": "Brand values: core values at the heart of the brand strategy, each with a descriptive sentence",
+            "questions": ["brand_values"],
+            "instructions": """You will find your Brand Values at the core of your Brand Strategy. State each value with a descriptive sentence. Avoid clichés like "transparent" and "honest."
+
+[List 3-5 values with descriptions]""",
+        },
+        {
+            "title": "Brand Mission",
+            "query": "Brand mission: where the brand is going and what it wants to achieve",
+            "questions": ["brand_mission"],
+            "instructions": """Detail exactly where your brand is going and what you want to achieve.
+
+[Write mission statement as a paragraph]""",
+        },
+        {
+            "title": "Brand Touchpoints",
+            "query": "Brand touchpoints: where and when customers come in contact with the brand",
+            "questions": ["touchpoints"],
+            "instructions": """A Brand Touch Point is the time and place where a customer comes in contact with your brand.
+
+[List and describe 5-8 touchpoints where customers interact with the brand]""",
+        },
+        {
+            "title": "Brand Messaging",
+            "query": "Brand messaging: key messages, what the brand communicates and brand pillars",
+            "questions": ["brand_messaging"],
+            "instructions": """Your Brand Messaging is "what" you're trying to communicate and how you communicate it.
+
+[List 3-5 key messages]
+[Optional: Break down into brand pillars]""",
+        },
+        {
+            "title": "Tone of Voice",
+            "query": "Tone of voice: how the brand communicates, characteristics with do's and don'ts",
+            "questions": ["tone_of_voice"],
+            "instructions": """Your Tone of Voice describes how your brand communicates with the audience and thus influences how people perceive your messaging.
+
+Create a table with:
+| Characteristic | Description | Do's | Don'ts |
+[Fill in 3-5 rows]""",
+        },
+    ],
+    "digital": [
+        {
+            "title": "Introduction",
+            "query": "Introduction: company background, products and services, SMART marketing goals",
+            "questions": ["company_background", "products_services", "marketing_goals"],
+            "instructions": """- Company Background
+- Products & Services
+- Marketing Goals (SMART format)""",
+        },
+        {
+            "title": "Research & Analysis",
+            "query": "Research and analysis: SWOT analysis, competitive analysis, target customers, buying cycle, "
+                     "unique selling proposition, brand relevance",
+            "questions": ["swot", "competitive_analysis", "target_customers", "buying_cycle", "usp", "brand_relevance"],
+            "instructions": """- SWOT Analysis
+- Competitive Analysis
+- Target Customers (detailed personas)
+- Buying Cycle
+- Unique Selling Proposition
+- Brand Relevance""",
+        },
+        {
+            "title": "Our Strategy",
+            "query": "Our strategy: flywheel attract engage delight, preliminary projects, key performance "
+                     "indicators by channel, marketing channels",
+            "questions": ["marketing_goals", "target_customers", "usp", "website_status", "social_media_status",
+                          "email_status", "other_channels", "marketing_budget", "friction_points"],
+            "instructions": """- Proposed Strategy (Flywheel: Attract/Engage/Delight)
+- Preliminary Projects
+- Key Performance Indicators (by channel)
+- Marketing Channels""",
+        },
+        {
+            "title": "The Road Ahead",
+            "query": "The road ahead: summary and next steps",
+            "questions": ["marketing_goals", "marketing_budget", "friction_points"],
+            "instructions": """- Summary
+- Next Steps""",
+        },
+    ],
+}
+
+# Answers every section of the document is given, whatever its own questions
+SHARED_QUESTIONS = {
+    "brand": ["company_overview", "additional_context"],
+    "digital": ["company_background", "additional_context"],
+}
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+def outline_prompt(agent_type):
+    """
+    The outline as the whole-document prompt lists it, so single mode and sections
+    mode write the same sections. Brand lists each section's heading with its
+    instructions; digital lists numbered section titles with their subsections.
+    """
+    outline = SECTION_OUTLINES[agent_type]
+    if agent_type == "digital":
+        text = "\n\n".join(f"{i}. {section['title'].upper()}\n"
+                           + "\n".join("   " + line for line in section["instructions"].splitlines())
+                           for i, section in enumerate(outline, 1))
+    else:
+        text = "\n\n".join(f"# {section['title']}\n{section['instructions']}" for section in outline)
+    # Prompt templates are filled in with str.format
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def section_answers(agent_type, section, answers):
+    """The shared answers plus the section's own, in question order, skipping blanks."""
+    wanted = SHARED_QUESTIONS.get(agent_type, []) + section["questions"]
+    return {question_id: answers[question_id] for question_id in dict.fromkeys(wanted)
+            if answers.get(question_id) and answers[question_id].strip()}
+
+
+def heading_key(text):
+    """Heading text reduced for comparison: no numbering, markup or case."""
+    text = re.sub(r"^\s*\d+(\.\d+)*[.)]?\s+", "", text.replace("*", "").replace("_", " "))
+    return " ".join(re.findall(r"\w+", text.lower().replace("&", " and ")))
+
+
+def normalize_section(title, text):
+    """
+    Makes a generated section fit the stitched document: the section heading is a
+    single "# title" line and the section's own headings start at level 2.
+    Code fences and text before the first heading are dropped.
+    """
+    lines = [line for line in text.strip().splitlines() if not line.strip().startswith("```")]
+    for i, line in enumerate(lines):
+        if HEADING_RE.match(line.strip()):
+            lines = lines[i:]
+            break
+    match = HEADING_RE.match(lines[0].strip()) if lines else None
+    if match and heading_key(match.group(2)) == heading_key(title):
+        lines = lines[1:]
+
+    levels = [len(m.group(1)) for m in (HEADING_RE.match(line.strip()) for line in lines) if m]
+    shift = 2 - min(levels) if levels else 0
+    body = []
+    for line in lines:
+        m = HEADING_RE.match(line.strip())
+        if m and shift:
+            line = "#" * min(len(m.group(1)) + shift, 6) + " " + m.group(2)
+        body.append(line)
+    return "\n".join([f"# {title}", "", "\n".join(body).strip()]).strip()
+
+
+def stitch_sections(outline, texts):
+    """Joins the normalized section texts in outline order."""
+    return "\n\n".join(normalize_section(section["title"], text) for section, text in zip(outline, texts)) + "\n"
+
+
+# Incremental updates
+def question_sections(agent_type):
+    """Dependency map of question id -> titles of the sections written from that answer."""
+    outline = SECTION_OUTLINES.get(agent_type, [])
+    dependencies = {}
+    for section in outline:
+        for question_id in SHARED_QUESTIONS.get(agent_type, []) + section["questions"]:
+            titles = dependencies.setdefault(question_id, [])
+            if section["title"] not in titles:
+                titles.append(section["title"])
+    return dependencies
+
+
+def changed_questions(old_answers, new_answers):
+    """Ids of the answers that differ, ignoring surrounding whitespace."""
+    return [question_id for question_id in dict.fromkeys(list(old_answers) + list(new_answers))
+            if (old_answers.get(question_id) or "").strip() != (new_answers.get(question_id) or "").strip()]
+
+
+def impacted_sections(agent_type, old_answers, new_answers):
+    """The outline sections to rewrite after an answer change, in outline order."""
+    dependencies = question_sections(agent_type)
+    titles = {title for question_id in changed_questions(old_answers, new_answers)
+              for title in dependencies.get(question_id, [])}
+    return [section for section in SECTION_OUTLINES.get(agent_type, []) if section["title"] in titles]
+
+
+def _heading_lines(lines):
+    """(line index, level, text) of the Markdown headings outside code fences."""
+    headings, in_fence = [], False
+    for i, line in enumerate(lines):
+        if line.strip().startswith("```"):
+            in_fence = not in_fence
+            continue
+        match = None if in_fence else HEADING_RE.match(line.strip())
+        if match:
+            headings.append((i, len(match.group(1)), match.group(2)))
+    return headings
+
+
+def find_section(lines, title):
+    """
+    (start, end, level) of the section headed by title, matched at the shallowest
+    heading level it appears at, or None. end is the next heading of the same or a
+    higher level.
+    """
+    headings = _heading_lines(lines)
+    # Spaces are ignored too, so "Touch Points" still matches "Touchpoints"
+    key = heading_key(title).replace(" ", "")
+    matches = [(level, i) for i, level, text in headings if heading_key(text).replace(" ", "") == key]
+    if not matches:
+        return None
+    level, start = min(matches)
+    end = next((i for i, other_level, _ in headings if i > start and other_level <= level), len(lines))
+    return start, end, level
+
+
+def _at_level(text, level):
+    """A normalized section with its headings moved down to start at `level`."""
+    lines = []
+    for line in text.splitlines():
+        match = HEADING_RE.match(line.strip())
+        if match and level > 1:
+            line = "#" * min(len(match.group(1)) + level - 1, 6) + " " + match.group(2)
+        lines.append(line)
+    return lines
+
+
+def splice_sections(outline, markdown, replacements):
+    """
+    Replaces the sections named in replacements ({title: text from normalize_section})
+    in a document, matching them by heading. Everything else is left untouched,
+    including manual edits. A section missing from the document is inserted after the
+    closest section before it in the outline, or at the start.
+    """
+    lines = markdown.splitlines()
+    order = [section["title"] for section in outline]
+    for title in sorted(replacements, key=lambda title: order.index(title) if title in order else len(order)):
+        found = find_section(lines, title)
+        if found:
+            start, end, level = found
+        else:
+            level, start = 1, 0
+            earlier = order[:order.index(title)] if title in order else order
+            for previous in reversed(earlier):
+                previous_found = find_section(lines, previous)
+                if previous_found:
+                    start, level = previous_found[1], previous_found[2]
+                    break
+            end = start
+        new_lines = _at_level(replacements[title], level)
+        if found:
+            new_lines[0] = lines[start]  # keep the document's own heading, numbering included
+        if end < len(lines):
+            new_lines.append("")
+        if start > 0 and lines[start - 1].strip():
+            new_lines.insert(0, "")
+        lines[start:end] = new_lines
+    return "\n".join(lines).rstrip() + "\n"
+
+
+# Validation
+def check_draft(outline, markdown, truncated=False):
+    """
+    Checks a draft against its outline. Returns the titles of the sections to repair, in
+    outline order: missing ones, ones with no text under the heading and, if the
+    completion was cut off (truncated=True), the section the draft ends in.
+    """
+    lines = markdown.splitlines()
+    found = {section["title"]: find_section(lines, section["title"]) for section in outline}
+    repair = set()
+    for title, position in found.items():
+        if position is None:
+            repair.add(title)
+            continue
+        start, end, _ = position
+        body = [line for line in lines[start + 1:end] if line.strip() and not HEADING_RE.match(line.strip())]
+        if not body:
+            repair.add(title)
+    present = [(position[0], title) for title, position in found.items() if position]
+    if truncated and present:
+        repair.add(max(present)[1])
+    return [section["title"] for section in outline if section["title"] in repair]
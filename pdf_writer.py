@@ -0,0 +1,532 @@
+# pdf_writer.py
+"""
+Renders a draft as a PDF in pure Python, with the same structure as the Word export:
+the title block, headings, paragraphs with bold/italic/code runs, bullet and
+numbered lists, quotes, code blocks and tables.
+
+Text is set in the standard Helvetica and Courier fonts, which every PDF reader
+has, so nothing is embedded and the output stays small. Lines are broken with the
+fonts' published widths. Each page is compressed and written to the output as soon
+as it is full, so memory stays bounded however long the document is.
+
+PdfExporter runs renders in a process pool, keyed by draft hash, so the Streamlit
+script never waits on one and a draft is only rendered once.
+
+    python pdf_writer.py [pages]    # benchmark
+"""
+import io
+import multiprocessing
+import re
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from markdown_docx import MAX_LIST_DEPTH, parse_inline, tokenize
+
+# Page geometry in points: US Letter, as the Word export
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 54
+FOOTER_SIZE = 8
+
+# (font size, space before, space after) per block style
+TITLE_STYLE = (24, 0, 6)
+HEADING_STYLES = {1: (18, 16, 6), 2: (14, 12, 4), 3: (12, 10, 4)}
+MINOR_HEADING_STYLE = (11, 8, 2)
+BODY_STYLE = (10.5, 0, 6)
+CODE_STYLE = (9, 2, 8)
+LINE_SPACING = 1.3
+LIST_INDENT = 18
+
+# Font resource names; F1-F4 are Helvetica regular/bold/oblique/bold-oblique
+FONTS = {
+    "F1": "Helvetica", "F2": "Helvetica-Bold", "F3": "Helvetica-Oblique",
+    "F4": "Helvetica-BoldOblique", "F5": "Courier",
+}
+CODE_FONT = "F5"
+
+# Helvetica advance widths (1/1000 em) for codes 32-126, from the Adobe font metrics;
+# the oblique faces share the widths of the upright ones and Courier is 600 throughout
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+# Punctuation above 126 that drafts use; (regular, bold)
+EXTRA_WIDTHS = {
+    "•": (350, 350), "–": (556, 556), "—": (1000, 1000), "…": (1000, 1000),
+    "‘": (222, 278), "’": (222, 278), "“": (333, 500), "”": (333, 500),
+    "€": (556, 556), "™": (1000, 1000), " ": (278, 278), "©": (737, 737),
+    "®": (737, 737), "°": (400, 400), "·": (278, 278),
+}
+
+CONTROL_RE = re.compile("[\x00-\x09\x0b-\x1f\x7f]")
+# ASCII stand-ins for symbols drafts use that the standard fonts lack
+SYMBOL_REPLACEMENTS = {
+    "→": "->", "←": "<-", "↔": "<->", "⇒": "=>", "⇐": "<=",
+    "≥": ">=", "≤": "<=", "≠": "!=", "≈": "~", "−": "-",
+    "✓": "[x]", "✔": "[x]", "✅": "[x]", "☑": "[x]",
+    "✗": "[ ]", "✘": "[ ]", "❌": "[ ]", "☐": "[ ]",
+    "★": "*", "⭐": "*",
+}
+WORD_RE = re.compile(r"\n|[ \t]+|[^\s]+")
+
+# Start a new page for a heading unless this much room is left below it
+KEEP_WITH_NEXT = 3 * BODY_STYLE[0] * LINE_SPACING
+
+
+def _width_table(base):
+    """Widths by character for everything WinAnsiEncoding (cp1252) can show."""
+    bold = base is HELVETICA_BOLD_WIDTHS
+    table = {}
+    for code in range(32, 256):
+        char = bytes([code]).decode("cp1252", errors="ignore")
+        if not char:
+            continue
+        if code < 127:
+            table[char] = base[code - 32]
+        elif char in EXTRA_WIDTHS:
+            table[char] = EXTRA_WIDTHS[char][bold]
+        else:
+            # Accented letters are as wide as their base letter
+            letter = unicodedata.normalize("NFD", char)[0]
+            table[char] = base[ord(letter) - 32] if 32 <= ord(letter) < 127 else 556
+    return table
+
+
+WIDTHS = {"F1": _width_table(HELVETICA_WIDTHS), "F2": _width_table(HELVETICA_BOLD_WIDTHS)}
+WIDTHS["F3"], WIDTHS["F4"] = WIDTHS["F1"], WIDTHS["F2"]
+
+
+def text_width(text, font, size):
+    if font == CODE_FONT:
+        return len(text) * 0.6 * size
+    widths = WIDTHS[font]
+    return sum(widths.get(char, 556) for char in text) * size / 1000
+
+
+def pdf_text(text):
+    """Text limited to what the WinAnsi-encoded standard fonts can show."""
+    text = CONTROL_RE.sub("", text)
+    try:
+        text.encode("cp1252")
+        return text
+    except UnicodeEncodeError:
+        pass
+    chars = []
+    for char in text:
+        try:
+            char.encode("cp1252")
+            chars.append(char)
+            continue
+        except UnicodeEncodeError:
+            pass
+        if char in SYMBOL_REPLACEMENTS:
+            chars.append(SYMBOL_REPLACEMENTS[char])
+            continue
+        folded = unicodedata.normalize("NFKD", char).encode("cp1252", errors="ignore").decode("cp1252")
+        if folded:
+            chars.append(folded)
+        elif unicodedata.category(char)[0] in "SM" or unicodedata.category(char) == "Cf":
+            continue  # other symbols and emoji, with their variation selectors and joiners, are dropped
+        else:
+            chars.append("?")  # letters and digits of scripts the fonts cannot show
+    return "".join(chars)
+
+
+def _string(text):
+    """A PDF string literal; content streams are latin-1 so each character is one cp1252 byte."""
+    raw = text.encode("cp1252").decode("latin-1")
+    return "(" + raw.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def _font(bold, italic, code):
+    if code:
+        return CODE_FONT
+    return ("F1", "F3", "F2", "F4")[bold * 2 + italic]
+
+
+class PdfFile:
+    """
+    Writes PDF objects straight to a binary output, which need not be seekable.
+    Pages are written as they are added; the page tree, fonts and cross-reference
+    table follow in close().
+    """
+
+    CATALOG, PAGES, RESOURCES = 1, 2, 3
+
+    def __init__(self, output, title=""):
+        self.output = output
+        self.title = title
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.font_ids = {name: 4 + i for i, name in enumerate(FONTS)}
+        self.next_id = 4 + len(FONTS)
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.output.write(data)
+        self.position += len(data)
+
+    def _object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        self._write(f"{object_id} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def add_page(self, content):
+        stream = zlib.compress(content.encode("latin-1"), 6)
+        content_id, page_id = self._new_id(), self._new_id()
+        self._object(content_id, f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode("latin-1")
+                     + stream + b"\nendstream")
+        self._object(page_id, (f"<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                               f"/Resources {self.RESOURCES} 0 R /Contents {content_id} 0 R >>").encode("latin-1"))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        for name, object_id in self.font_ids.items():
+            self._object(object_id, (f"<< /Type /Font /Subtype /Type1 /BaseFont /{FONTS[name]} "
+                                     f"/Encoding /WinAnsiEncoding >>").encode("latin-1"))
+        fonts = " ".join(f"/{name} {object_id} 0 R" for name, object_id in self.font_ids.items())
+        self._object(self.RESOURCES, f"<< /Font << {fonts} >> >>".encode("latin-1"))
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._object(self.PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode("latin-1"))
+        self._object(self.CATALOG, f"<< /Type /Catalog /Pages {self.PAGES} 0 R >>".encode("latin-1"))
+        info_id = self._new_id()
+        self._object(info_id, (f"<< /Title {_string(pdf_text(self.title))} "
+                               f"/CreationDate (D:{datetime.now().strftime('%Y%m%d%H%M%S')}) >>").encode("latin-1"))
+
+        xref = self.position
+        lines = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[object_id]:010d} 00000 n \n" for object_id in range(1, self.next_id)]
+        lines.append(f"trailer\n<< /Size {self.next_id} /Root {self.CATALOG} 0 R /Info {info_id} 0 R >>\n"
+                     f"startxref\n{xref}\n%%EOF\n")
+        self._write("".join(lines).encode("latin-1"))
+
+
+class PdfRenderer:
+    """
+    Lays tokenized Markdown out on pages. Mirrors markdown_docx.DocxRenderer: same
+    blocks, list nesting and numbering restarts; horizontal rules are skipped there
+    too.
+    """
+
+    def __init__(self, pdf, footer=""):
+        self.pdf = pdf
+        self.footer = pdf_text(footer)
+        self.page_number = 0
+        self.ops = None
+        self.y = 0
+        self.list_numbers = {}
+        self.item_indent = None  # indent of the open list item, for continuation lines
+        self.table_header = None  # (lines, widths) repeated when a table breaks across pages
+
+    # Pages
+    def _new_page(self):
+        self._finish_page()
+        self.page_number += 1
+        self.ops = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _finish_page(self):
+        if self.ops is None:
+            return
+        footer_y = MARGIN / 2
+        self.ops.append("0.45 g")
+        self.ops.append(self._text_op(MARGIN, footer_y, self.footer, "F1", FOOTER_SIZE))
+        number = f"Page {self.page_number}"
+        x = PAGE_WIDTH - MARGIN - text_width(number, "F1", FOOTER_SIZE)
+        self.ops.append(self._text_op(x, footer_y, number, "F1", FOOTER_SIZE))
+        self.pdf.add_page("\n".join(self.ops))
+        self.ops = None
+
+    def _room(self, height):
+        """Starts a new page unless height points fit above the bottom margin."""
+        if self.ops is None or self.y - height < MARGIN:
+            self._new_page()
+
+    @staticmethod
+    def _text_op(x, y, text, font, size):
+        return f"BT /{font} {size:g} Tf {x:.2f} {y:.2f} Td {_string(text)} Tj ET"
+
+    # Line breaking
+    def _wrap(self, runs, width, size):
+        """Breaks (text, bold, italic, code) runs into lines of (text, font) fragments."""
+        lines, line, line_width = [], [], 0
+        for text, bold, italic, code in runs:
+            font = _font(bold, italic, code)
+            for word in WORD_RE.findall(pdf_text(text)):
+                if word == "\n":
+                    lines.append(line)
+                    line, line_width = [], 0
+                    continue
+                if word[0] in " \t":
+                    if line:
+                        word = " "
+                    else:
+                        continue
+                word_width = text_width(word, font, size)
+                if line_width + word_width > width and line:
+                    lines.append(line)
+                    line, line_width = [], 0
+                    if word == " ":
+                        continue
+                while word_width > width:
+                    # A word wider than the line is broken wherever it has to be
+                    cut = max(1, int(len(word) * width / word_width))
+                    while cut > 1 and text_width(word[:cut], font, size) > width:
+                        cut -= 1
+                    lines.append([(word[:cut], font)])
+                    word = word[cut:]
+                    word_width = text_width(word, font, size)
+                if word:
+                    # Consecutive words in one font are drawn as one string
+                    if line and line[-1][1] == font:
+                        line[-1] = (line[-1][0] + word, font)
+                    else:
+                        line.append((word, font))
+                    line_width += word_width
+        if line or not lines:
+            lines.append(line)
+        return lines
+
+    def _draw_line(self, x, baseline, line, size):
+        for text, font in line:
+            if text.strip():
+                self.ops.append(self._text_op(x, baseline, text, font, size))
+            x += text_width(text, font, size)
+
+    def _block(self, runs, style, indent=0, marker=None, bar=False):
+        """A wrapped paragraph; marker is a list bullet or number hung left of the text."""
+        size, before, after = style
+        leading = size * LINE_SPACING
+        x = MARGIN + indent
+        lines = self._wrap(runs, PAGE_WIDTH - MARGIN - x, size)
+        if self.ops is not None and self.y < PAGE_HEIGHT - MARGIN:
+            self.y -= before
+        for i, line in enumerate(lines):
+            self._room(leading)
+            baseline = self.y - size
+            if bar:
+                self.ops.append(f"0.75 G 2 w {x - 10:.2f} {self.y:.2f} m {x - 10:.2f} {self.y - leading:.2f} l S 0 G")
+            if marker and i == 0:
+                marker_x = x - 4 - text_width(marker, "F1", size)
+                self.ops.append(self._text_op(marker_x, baseline, marker, "F1", size))
+            self._draw_line(x, baseline, line, size)
+            self.y -= leading
+        self.y -= after
+
+    # Blocks
+    def render(self, markdown):
+        for block in tokenize(markdown):
+            kind = block[0]
+            if kind == "blank":
+                continue
+            if kind not in ("list_item", "list_item_text"):
+                self.list_numbers = {}
+                self.item_indent = None
+            getattr(self, "_" + kind)(*block[1:])
+
+    def title_block(self, title, subtitle):
+        self._block(parse_inline(title, bold=True), TITLE_STYLE)
+        self._block(parse_inline(subtitle), BODY_STYLE)
+        self._block([], BODY_STYLE)
+
+    def _heading(self, level, text):
+        style = HEADING_STYLES.get(level, MINOR_HEADING_STYLE)
+        self._room(style[0] * LINE_SPACING + style[1] + KEEP_WITH_NEXT)
+        self._block(parse_inline(text, bold=True), style)
+
+    def _paragraph(self, text):
+        self._block(parse_inline(text), BODY_STYLE)
+
+    def _quote(self, text):
+        self._block(parse_inline(text, italic=True), BODY_STYLE, indent=LIST_INDENT, bar=True)
+
+    def _code(self, text):
+        size = CODE_STYLE[0]
+        chars = int((PAGE_WIDTH - 2 * MARGIN - 8) / (0.6 * size))
+        lines = []
+        for line in pdf_text(text).split("\n"):
+            lines.extend([line[i:i + chars] for i in range(0, len(line), chars)] or [""])
+        leading = size * LINE_SPACING
+        self.y -= CODE_STYLE[1]
+        for line in lines:
+            self._room(leading)
+            self.ops.append(f"0.95 g {MARGIN:.2f} {self.y - leading:.2f} {PAGE_WIDTH - 2 * MARGIN:.2f} "
+                            f"{leading:.2f} re f 0 g")
+            self.ops.append(self._text_op(MARGIN + 4, self.y - size, line, CODE_FONT, size))
+            self.y -= leading
+        self.y -= CODE_STYLE[2]
+
+    def _rule(self):
+        pass
+
+    def _list_item(self, ordered, depth, start, text):
+        depth = min(depth, MAX_LIST_DEPTH - 1)
+        for deeper in [d for d in self.list_numbers if d > depth]:
+            del self.list_numbers[deeper]
+        if ordered:
+            number = self.list_numbers.get(depth, start - 1) + 1
+            self.list_numbers[depth] = number
+            marker = f"{number}."
+        else:
+            self.list_numbers.pop(depth, None)
+            marker = "•"
+        self.item_indent = LIST_INDENT * (depth + 1)
+        size, before, after = BODY_STYLE
+        self._block(parse_inline(text), (size, before, after / 2), indent=self.item_indent, marker=marker)
+
+    def _list_item_text(self, text):
+        if self.item_indent is None:
+            return self._paragraph(text)
+        size, before, after = BODY_STYLE
+        self._block(parse_inline(text), (size, before, after / 2), indent=self.item_indent)
+
+    def _table(self, rows):
+        size = BODY_STYLE[0]
+        padding = 4
+        columns = max(len(row) for row in rows)
+        width = (PAGE_WIDTH - 2 * MARGIN) / columns
+        self.y -= BODY_STYLE[1]
+        for row_index, row in enumerate(rows):
+            cells = [self._wrap(parse_inline(text, bold=row_index == 0), width - 2 * padding, size)
+                     for text in row + [""] * (columns - len(row))]
+            if row_index == 0:
+                self.table_header = cells
+            self._table_row(cells, width, padding, size, header=row_index == 0)
+        self.table_header = None
+        self.y -= BODY_STYLE[2]
+
+    def _table_row(self, cells, width, padding, size, header=False):
+        """Draws a row, continuing it on the next page (under the repeated header) if it is too tall."""
+        leading = size * LINE_SPACING
+        lines = max(len(cell) for cell in cells)
+        done, new_page = 0, False
+        while done < lines:
+            fits = int((self.y - MARGIN - 2 * padding) // leading) if self.ops is not None else 0
+            if fits < lines - done and not new_page:
+                # Rows move to the next page whole, and are only split when taller than a page
+                self._new_page()
+                if not header and self.table_header:
+                    self._table_row(self.table_header, width, padding, size, header=True)
+                new_page = True
+                continue
+            take = max(1, min(lines - done, fits))
+            height = take * leading + 2 * padding
+            top = self.y
+            self.ops.append("0.6 G 0.5 w")
+            for column, cell in enumerate(cells):
+                x = MARGIN + column * width
+                self.ops.append(f"{x:.2f} {top - height:.2f} {width:.2f} {height:.2f} re S")
+                for i, line in enumerate(cell[done:done + take]):
+                    self._draw_line(x + padding, top - padding - i * leading - size, line, size)
+            self.ops.append("0 G")
+            self.y -= height
+            done += take
+            new_page = False
+
+    def close(self):
+        if self.ops is None:
+            self._new_page()
+        self._finish_page()
+        self.pdf.close()
+
+
+def write_pdf(markdown_text, client_name, output):
+    """
+    Writes the draft as a PDF to output, a path or a binary file, with the same title
+    block as generator2.export_to_word. Pages are written as they fill up.
+    """
+    if isinstance(output, str):
+        with open(output, "wb") as f:
+            return write_pdf(markdown_text, client_name, f)
+    title = f"{client_name} - Strategy Document"
+    renderer = PdfRenderer(PdfFile(output, title), footer=title)
+    renderer.title_block(title, f"Generated on: {datetime.now().strftime('%B %d, %Y')}")
+    renderer.render(markdown_text)
+    renderer.close()
+    return output
+
+
+def render_pdf(markdown_text, client_name):
+    """The PDF as bytes; runs in PdfExporter's worker processes."""
+    buffer = io.BytesIO()
+    write_pdf(markdown_text, client_name, buffer)
+    return buffer.getvalue()
+
+
+# Process pool
+class PdfExporter:
+    """
+    Renders PDFs in worker processes. Renders are kept by key (the draft hash) as
+    futures, so the app can submit one, poll it on later reruns and serve the
+    bytes again without rendering twice. Holds up to max_entries finished renders.
+    """
+
+    def __init__(self, workers=2, max_entries=32):
+        self.workers = workers
+        self.max_entries = max_entries
+        self.futures = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        # spawn, not fork: the Streamlit server process runs threads
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, key, markdown_text, client_name):
+        """Starts rendering unless key is already rendered or rendering; returns its future."""
+        with self._lock:
+            future = self.futures.get(key)
+            if future is not None and not (future.done() and future.exception() is not None):
+                self.futures.move_to_end(key)
+                return future
+            try:
+                future = self._executor.submit(render_pdf, markdown_text, client_name)
+            except BrokenProcessPool:
+                print("PDF worker pool broke, starting a new one")
+                self._executor = self._new_executor()
+                future = self._executor.submit(render_pdf, markdown_text, client_name)
+            self.futures[key] = future
+            finished = [k for k, f in self.futures.items() if f.done()]
+            for old_key in finished[:max(0, len(self.futures) - self.max_entries)]:
+                del self.futures[old_key]
+            return future
+
+    def get(self, key):
+        with self._lock:
+            return self.futures.get(key)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from markdown_docx import sample_strategy
+
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    markdown = sample_strategy(pages)
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    write_pdf(markdown, "Benchmark", buffer)
+    elapsed = time.perf_counter() - started
+    print(f"{pages} pages of Markdown: {elapsed:.3f}s, {len(buffer.getvalue())} bytes")
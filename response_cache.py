@@ -0,0 +1,85 @@
+# response_cache.py
+import hashlib
+import json
+import re
+import time
+
+from storage import sqlite_connection
+
+CACHE_PATH = "./response_cache.sqlite3"
+
+# Eviction: least recently used entries beyond MAX_ENTRIES, and anything older than MAX_AGE_SECONDS
+MAX_ENTRIES = 500
+MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+def normalize_answers(answers):
+    """Answers as compared for caching: blank answers dropped, whitespace tidied, keys sorted."""
+    normalized = {}
+    for question_id, answer in answers.items():
+        lines = [re.sub(r"[ \t]+", " ", line).strip() for line in (answer or "").replace("\r\n", "\n").split("\n")]
+        text = "\n".join(lines).strip()
+        if text:
+            normalized[question_id] = text
+    return dict(sorted(normalized.items()))
+
+
+class ResponseCache:
+    """
+    Completed drafts in a local SQLite file, keyed by a hash of everything that went
+    into the request. Every call opens its own connection, so the cache can be shared
+    by threads and by several app processes.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, max_age=MAX_AGE_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            db.executemany("INSERT OR IGNORE INTO counters VALUES (?, 0)", [("hits",), ("misses",)])
+
+    def _connect(self):
+        return sqlite_connection(self.path)
+
+    @staticmethod
+    def key(**parts):
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """The cached value, or None if missing or expired. Counts a hit or a miss."""
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute("SELECT value FROM responses WHERE key = ? AND created_at >= ?",
+                             (key, now - self.max_age)).fetchone()
+            db.execute("UPDATE counters SET value = value + 1 WHERE name = ?", ("hits" if row else "misses",))
+            if row is None:
+                return None
+            db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, json.dumps(value), now, now))
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age,))
+        db.execute("""DELETE FROM responses WHERE key IN (
+            SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+
+    def stats(self):
+        with self._connect() as db:
+            counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+            entries = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "entries": entries}
+
+    def clear(self):
+        with self._connect() as db:
+            db.execute("DELETE FROM responses")
+            db.execute("UPDATE counters SET value = 0")
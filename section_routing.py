@@ -0,0 +1,62 @@
+# section_routing.py
+import hashlib
+import json
+import os
+
+ROUTING_PATH = "./section_routing.json"
+
+# Template chunks kept per outline section
+CHUNKS_PER_SECTION = 4
+
+
+def routing_version(*parts):
+    """Hash of everything the table depends on (templates, outlines, model, settings)."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_routing_table(path=ROUTING_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_routing_table(outlines, search_sections, version, path=ROUTING_PATH):
+    """
+    Maps every outline section to its best matching template chunks.
+
+    search_sections(agent_type, queries, n_results) returns one hit list per query
+    ([{"id", "text", "metadata", "score"}], best first); it is called once per agent
+    type with all of that outline's section queries.
+    """
+    sections = {}
+    for agent_type, outline in outlines.items():
+        results = search_sections(agent_type, [section["query"] for section in outline], CHUNKS_PER_SECTION)
+        sections[agent_type] = {section["title"]: hits for section, hits in zip(outline, results)}
+    table = {"version": version, "sections": sections}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table, f)
+    os.replace(tmp_path, path)
+    return table
+
+
+def routed_hits(table, agent_type, titles=None):
+    """
+    Chunks routed to the given sections (all sections by default). Scores are
+    1 / (60 + rank within the section), so every section's best chunk ranks ahead
+    of any section's second best when the context packer fills its budget.
+    """
+    if not table:
+        return []
+    routed = table["sections"].get(agent_type, {})
+    hits, seen = [], set()
+    for title in titles or list(routed):
+        for rank, hit in enumerate(routed.get(title, []), start=1):
+            if hit["id"] in seen:
+                continue
+            seen.add(hit["id"])
+            hits.append(dict(hit, score=1.0 / (60 + rank)))
+    return hits
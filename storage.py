@@ -0,0 +1,35 @@
+# storage.py
+"""
+Small helpers shared by the modules that keep state on disk: resume logs written
+one JSON record per line, and SQLite databases opened per operation.
+"""
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+
+def read_jsonl(path):
+    """Yields the records of a JSON-lines log; a missing file has none."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Last line of an interrupted run may be cut off
+                continue
+
+
+@contextmanager
+def sqlite_connection(path, row_factory=None):
+    """A connection to path whose statements run in one transaction, committed on success."""
+    db = sqlite3.connect(path, timeout=30)
+    if row_factory is not None:
+        db.row_factory = row_factory
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
@@ -0,0 +1,130 @@
+# fake_openai_server.py
+"""
+A local stand-in for the chat completions API, for testing llm_client without
+the network.
+
+    server = FakeOpenAIServer().start()
+    server.script = [{"status": 429, "retry_after": "0.1"}, {"delay": 0.5}]
+    client = LLMClient(api_key="test", base_url=server.base_url)
+
+Each request takes the next entry of `script` (a plain success once it is used
+up): "status" answers with that error and "retry_after" / "retry_after_ms" set the
+headers, "delay" waits before answering and "text" is the completion. Streams are
+sent as server-sent events, with a usage chunk when stream_options asks for one.
+Requests and the most requests handled at once are recorded.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TEXT = "# Company Description\nHello from the fake server"
+# Characters per streamed chunk
+STREAM_PIECE = 8
+
+
+class FakeOpenAIServer:
+    def __init__(self):
+        self.script = []
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+                step = server._next_step(body)
+                try:
+                    time.sleep(step.get("delay", 0))
+                    if step.get("status"):
+                        headers = {}
+                        if step.get("retry_after") is not None:
+                            headers["retry-after"] = str(step["retry_after"])
+                        if step.get("retry_after_ms") is not None:
+                            headers["retry-after-ms"] = str(step["retry_after_ms"])
+                        self._json(step["status"], {"error": {"message": "scripted error", "type": "test"}}, headers)
+                    elif body.get("stream"):
+                        self._stream(body, step.get("text", DEFAULT_TEXT))
+                    else:
+                        text = step.get("text", DEFAULT_TEXT)
+                        self._json(200, {
+                            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+                            "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                         "finish_reason": "stop"}],
+                            "usage": _usage(text),
+                        })
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, text):
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("transfer-encoding", "chunked")
+                self.end_headers()
+                for start in range(0, len(text), STREAM_PIECE):
+                    self._event({"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0,
+                                 "model": body["model"],
+                                 "choices": [{"index": 0, "delta": {"content": text[start:start + STREAM_PIECE]},
+                                              "finish_reason": None}]})
+                self._event({"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0,
+                             "model": body["model"],
+                             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self._event({"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0,
+                                 "model": body["model"], "choices": [], "usage": _usage(text)})
+                self._chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _event(self, payload):
+                self._chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+            def _chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next_step(self, body):
+        with self._lock:
+            self.requests.append(body)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return self.script.pop(0) if self.script else {}
+
+
+def _usage(text):
+    completion_tokens = max(1, len(text) // 4)
+    return {"prompt_tokens": 10, "completion_tokens": completion_tokens, "total_tokens": 10 + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0}}
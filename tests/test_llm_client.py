@@ -0,0 +1,141 @@
+# test_llm_client.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+import pytest
+
+import llm_client
+from fake_openai_server import DEFAULT_TEXT, FakeOpenAIServer
+from llm_client import LLMClient, TokenBucket
+
+MESSAGES = [{"role": "user", "content": "Write the draft"}]
+
+
+@pytest.fixture
+def server():
+    server = FakeOpenAIServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    # Keep the jitter added to Retry-After waits small
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.01)
+
+
+def make_client(server, **kwargs):
+    return LLMClient(api_key="test", base_url=server.base_url, **kwargs)
+
+
+# Retries
+def test_retries_rate_limits_after_retry_after(server):
+    server.script = [{"status": 429, "retry_after": "0.3"}, {"status": 503, "retry_after_ms": "200"}]
+    client = make_client(server)
+    started = time.monotonic()
+    response = client.chat(model="gpt-4o-mini", messages=MESSAGES)
+    assert response.choices[0].message.content == DEFAULT_TEXT
+    assert time.monotonic() - started >= 0.5
+    assert len(server.requests) == 3
+    metrics = client.metrics()
+    assert metrics["retries"] == 2
+    assert metrics["rate_limited"] == 1
+    assert metrics["completed"] == 1
+
+
+def test_does_not_retry_client_errors(server):
+    server.script = [{"status": 400}]
+    client = make_client(server)
+    with pytest.raises(openai.BadRequestError):
+        client.chat(model="gpt-4o-mini", messages=MESSAGES)
+    assert len(server.requests) == 1
+    assert client.metrics()["failures"] == 1
+
+
+def test_gives_up_after_max_retries(server):
+    server.script = [{"status": 500}] * 3
+    client = make_client(server, max_retries=2)
+    with pytest.raises(openai.InternalServerError):
+        client.chat(model="gpt-4o-mini", messages=MESSAGES)
+    assert len(server.requests) == 3
+
+
+# Deadlines
+def test_slow_response_hits_deadline(server):
+    server.script = [{"delay": 3}]
+    client = make_client(server)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.chat(model="gpt-4o-mini", messages=MESSAGES, deadline=0.5)
+    assert time.monotonic() - started < 2
+    assert client.metrics()["timeouts"] == 1
+
+
+def test_retry_after_past_deadline_fails_at_once(server):
+    server.script = [{"status": 429, "retry_after": "30"}]
+    client = make_client(server)
+    started = time.monotonic()
+    with pytest.raises(openai.RateLimitError):
+        client.chat(model="gpt-4o-mini", messages=MESSAGES, deadline=2)
+    assert time.monotonic() - started < 1
+    assert len(server.requests) == 1
+
+
+# Limits
+def test_concurrency_limit(server):
+    server.script = [{"delay": 0.2}] * 6
+    client = make_client(server, max_concurrency=2)
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        responses = list(executor.map(lambda _: client.chat(model="gpt-4o-mini", messages=MESSAGES), range(6)))
+    assert len(responses) == 6
+    assert server.max_in_flight == 2
+    assert client.metrics()["max_queued"] >= 4
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(600)  # 10 per second
+
+    async def drain():
+        await bucket.acquire(600)
+        started = time.monotonic()
+        await bucket.acquire(5)
+        return time.monotonic() - started
+
+    assert 0.4 <= asyncio.run(drain()) < 1.0
+
+
+def test_unused_token_estimate_is_refunded(server):
+    client = make_client(server, tokens_per_minute=100000)
+    client.chat(model="gpt-4o-mini", messages=MESSAGES, max_tokens=50000)
+    # Only the reported usage stays charged, not the 50000 max_tokens
+    assert client.token_bucket.tokens > 99000
+
+
+# Streaming
+def test_stream_requests_usage_and_refunds_estimate(server):
+    client = make_client(server, tokens_per_minute=100000)
+    chunks = list(client.stream_chat(model="gpt-4o-mini", messages=MESSAGES, max_tokens=50000))
+    text = "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices)
+    assert text == DEFAULT_TEXT
+    assert server.requests[0]["stream_options"] == {"include_usage": True}
+    assert chunks[-1].usage.total_tokens > 0
+    assert client.metrics()["completion_tokens"] == chunks[-1].usage.completion_tokens
+    assert client.token_bucket.tokens > 99000
+
+
+def test_stream_retries_before_first_chunk(server):
+    server.script = [{"status": 503, "retry_after": "0.1"}]
+    client = make_client(server)
+    chunks = list(client.stream_chat(model="gpt-4o-mini", messages=MESSAGES))
+    assert "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices) == DEFAULT_TEXT
+    assert len(server.requests) == 2
+    assert client.metrics()["retries"] == 1
+
+
+def test_slow_stream_hits_deadline(server):
+    server.script = [{"delay": 3}]
+    client = make_client(server)
+    with pytest.raises(TimeoutError):
+        list(client.stream_chat(model="gpt-4o-mini", messages=MESSAGES, deadline=0.5))
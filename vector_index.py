@@ -0,0 +1,206 @@
+# vector_index.py
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+INDEX_DIR = "./vector_index"
+
+# Each build goes to its own version directory; CURRENT names the live one. Builds
+# kept besides the live one, so a reader still loading the previous one can finish
+KEEP_VERSIONS = 2
+
+# Metadata keys whose row masks are built when the index is loaded
+MASK_KEYS = ("type",)
+
+
+def current_version(index_dir):
+    """The name of the published build in index_dir, or None before the first build."""
+    try:
+        with open(os.path.join(index_dir, "CURRENT"), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def new_version(index_dir):
+    """Creates an empty directory for a new build. Returns (version, its path)."""
+    version = f"v{time.time_ns()}-{os.getpid()}"
+    version_dir = os.path.join(index_dir, version)
+    os.makedirs(version_dir)
+    return version, version_dir
+
+
+def publish_version(index_dir, version):
+    """
+    Makes version the live build and removes all but KEEP_VERSIONS older ones.
+    Publishing is one rename, so readers switch to all of a build's files at once.
+    """
+    current_path = os.path.join(index_dir, "CURRENT")
+    tmp_path = f"{current_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, current_path)
+    versions = sorted(name for name in os.listdir(index_dir)
+                      if name.startswith("v") and os.path.isdir(os.path.join(index_dir, name)))
+    old = [name for name in versions if name != version][:-KEEP_VERSIONS or None]
+    for name in old:
+        # Still mapped by a reader on Windows: left for a later build to remove
+        shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+
+class MetadataMasks:
+    """
+    Boolean row masks for Chroma-style where filters over a list of metadatas.
+    Masks for MASK_KEYS are built up front, others on first use.
+    """
+
+    def __init__(self, metadatas):
+        self.metadatas = [metadata or {} for metadata in metadatas]
+        self.masks = {}
+        for key in MASK_KEYS:
+            for value in {metadata.get(key) for metadata in self.metadatas}:
+                self._value_mask(key, value)
+
+    def _value_mask(self, key, value):
+        mask = self.masks.get((key, value))
+        if mask is None:
+            mask = np.fromiter((metadata.get(key) == value for metadata in self.metadatas),
+                               dtype=bool, count=len(self.metadatas))
+            self.masks[(key, value)] = mask
+        return mask
+
+    def where_mask(self, where):
+        """Row mask for the Chroma where-filter subset used here: equality, $eq, $in, $and, $or."""
+        mask = np.ones(len(self.metadatas), dtype=bool)
+        for key, condition in (where or {}).items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.where_mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(len(self.metadatas), dtype=bool)
+                for clause in condition:
+                    any_mask |= self.where_mask(clause)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                for operator, value in condition.items():
+                    if operator == "$eq":
+                        mask &= self._value_mask(key, value)
+                    elif operator == "$in":
+                        in_mask = np.zeros(len(self.metadatas), dtype=bool)
+                        for item in value:
+                            in_mask |= self._value_mask(key, item)
+                        mask &= in_mask
+                    else:
+                        raise ValueError(f"Unsupported where operator: {operator}")
+            else:
+                mask &= self._value_mask(key, condition)
+        return mask
+
+
+class NumpyVectorIndex:
+    """
+    Exact nearest-neighbour search over all chunk vectors in one float32 matrix.
+
+    The matrix is memory-mapped from vectors.f32; ids, documents and metadatas live in
+    rows.json. Both are written to a new version directory on every build and published
+    together by rewriting the CURRENT file, so a reader never pairs one build's vectors
+    with another's rows. query() mirrors collection.query() (squared L2 distances, like
+    Chroma's default space) so retrieve_context can use either backend. Metadata
+    filters are answered with boolean row masks instead of per-row checks.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.filters = MetadataMasks([])
+        self._loaded_version = None
+        self.refresh()
+
+    def count(self):
+        return len(self.ids)
+
+    def refresh(self):
+        """(Re)loads the index if another process or call published a new build."""
+        version = current_version(self.index_dir)
+        if version is None or version == self._loaded_version:
+            return
+        version_dir = os.path.join(self.index_dir, version)
+        with open(os.path.join(version_dir, "rows.json"), encoding="utf-8") as f:
+            rows = json.load(f)
+        dim = rows["dim"]
+        if rows["ids"]:
+            vectors = np.memmap(os.path.join(version_dir, "vectors.f32"), dtype=np.float32, mode="r",
+                                shape=(len(rows["ids"]), dim))
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ids, self.documents = rows["ids"], rows["documents"]
+        self.filters = MetadataMasks(rows["metadatas"])
+        self.metadatas = self.filters.metadatas
+        self.vectors = vectors
+        self.norms = np.einsum("ij,ij->i", vectors, vectors)
+        self._loaded_version = version
+
+    def build(self, ids, embeddings, documents, metadatas):
+        if len(ids):
+            vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        else:
+            # An empty collection has no vectors to take the dimension from
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        version, version_dir = new_version(self.index_dir)
+        with open(os.path.join(version_dir, "vectors.f32"), "wb") as f:
+            f.write(vectors.tobytes())
+        with open(os.path.join(version_dir, "rows.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": vectors.shape[1],
+                "ids": list(ids),
+                "documents": list(documents),
+                "metadatas": list(metadatas),
+            }, f)
+        publish_version(self.index_dir, version)
+        self.refresh()
+
+    def build_from_collection(self, collection, data=None):
+        data = data or collection.get(include=["embeddings", "documents", "metadatas"])
+        self.build(data["ids"], data["embeddings"], data["documents"], data["metadatas"])
+        print(f"NumPy vector index rebuilt: {self.count()} rows")
+
+    def search(self, query_vectors, n_results, where=None):
+        """
+        Returns (row indices, squared L2 distances), one array per query, nearest first.
+        All queries are scored with a single matrix product.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        candidates = np.flatnonzero(self.filters.where_mask(where))
+        if not len(candidates) or not n_results:
+            return [np.zeros(0, dtype=np.int64)] * len(queries), [np.zeros(0, dtype=np.float32)] * len(queries)
+        # One product against the whole matrix, then keep the columns the filter allows
+        distances = (self.norms[None, :] - 2.0 * (queries @ self.vectors.T)
+                     + np.einsum("ij,ij->i", queries, queries)[:, None])[:, candidates]
+        k = min(n_results, len(candidates))
+        if k < len(candidates):
+            top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(len(candidates)), (len(queries), 1))
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        # Distances equal up to float32 rounding keep index order, as Chroma returns them
+        order = np.lexsort((top, np.round(top_distances, 5)), axis=1)
+        rows = candidates[np.take_along_axis(top, order, axis=1)]
+        return list(rows), list(np.take_along_axis(top_distances, order, axis=1))
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        """Same result layout as collection.query()."""
+        self.refresh()
+        rows, distances = self.search(query_embeddings, n_results, where)
+        return {
+            "ids": [[self.ids[i] for i in query_rows] for query_rows in rows],
+            "documents": [[self.documents[i] for i in query_rows] for query_rows in rows],
+            "metadatas": [[self.metadatas[i] for i in query_rows] for query_rows in rows],
+            "distances": [[float(d) for d in query_distances] for query_distances in distances],
+        }